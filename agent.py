@@ -1,7 +1,11 @@
 import numpy as np
-import random
 
+import states
+import symmetry
+from convergence import ConvergenceTracker
 from game import Game
+from policies import EpsilonGreedy
+from qtable import CompactQMatrix, SparseQMatrix
 
 # Hannah Galbraith
 # CS546
@@ -16,21 +20,61 @@ from game import Game
 
 class Agent(object):
     
-    def __init__(self, eta, gamma, epsilon):
+    def __init__(self, eta, gamma, epsilon, compact=False, symmetric=False, policy=None, size=3, sparse=False,
+                 max_rows=None):
         """ :param eta: float between [0.0, 1.0]
             :param gamma: float between (0.0, 1.0] 
             :param epsilon: float between (0.0, 1.0] 
+            :param compact: if True, store the QMatrix as a float32 CompactQMatrix with rows only for 
+                            reachable positions instead of a dense (3^9, 9) float64 array
+            :param symmetric: if True, boards that are rotations or reflections of each other share
+                              one QMatrix row (see get_state)
+            :param policy: policies.Policy object used to choose moves, or None for policies.EpsilonGreedy
+            :param size: number of rows and columns of the board the agent plays on (see Game)
+            :param sparse: if True, store the QMatrix as a SparseQMatrix that only allocates the rows of
+                           the positions it visits. Boards other than 3x3 always use one, since a dense
+                           QMatrix would need 3^(size*size) rows.
+            :param max_rows: with a SparseQMatrix, the maximum number of rows to keep (least recently
+                             used rows are evicted), or None for no limit
             
             Initializes QMatrix and sets eta, gamma, epsilon, and player. 
             Initializes prev_state and prev_action to None. """
 
-        self.qmatrix = np.zeros((3**9, 9))
+        if size != 3 and (compact or symmetric):
+            raise ValueError("Compact and symmetric QMatrices are only available for 3x3 boards.")
+
+        if sparse or size != 3:
+            self.qmatrix = SparseQMatrix(size * size, max_rows=max_rows)
+        elif compact:
+            self.qmatrix = CompactQMatrix()
+        else:
+            self.qmatrix = np.zeros((3**9, 9))
+        self.size = size
         self.eta = eta
         self.gamma = gamma
         self.epsilon = epsilon
+        self.symmetric = symmetric
+        self.policy = EpsilonGreedy() if policy is None else policy
         self.player = 'X'
         self.prev_state = None
         self.prev_action = None
+        self.training_games = 0     # Number of games finished by qlearning and qlearning_batch
+        self.convergence = ConvergenceTracker()     # Size of the updates made by update_qmatrix
+
+
+    def get_state(self, game):
+        """ :param game: Game object
+
+            Returns the QMatrix row index for the current board and the symmetry 'frame' of that row. 
+            For a symmetric agent the row is the board's canonical form (symmetry.CANONICAL) and 'frame' 
+            is the rotation or reflection that takes the board there, which is used to map the chosen
+            column back onto the board (see get_position). Otherwise the row is the board's own index and 
+            'frame' is 0, the identity. """
+
+        state = game.translate_board_state_to_index()
+        if self.symmetric:
+            return symmetry.CANONICAL_LIST[state], symmetry.TRANSFORM_LIST[state]
+        return state, 0
 
 
     def update_epsilon(self, delta):
@@ -46,6 +90,72 @@ class Agent(object):
             self.epsilon += delta
 
     
+    def action_values(self, state):
+        """ :param state: base-3 state index of a board, or array of them
+
+            Returns the 9 Q-values of the board's cells, in the board's own frame (i.e. value [i] is for
+            the cell i = 3*row + col of the board, even for a symmetric agent). For an array of states,
+            returns an array with one row of values per state. """
+
+        if self.symmetric:
+            rows = np.asarray(self.qmatrix[symmetry.CANONICAL[state]])
+            return np.take_along_axis(rows, symmetry.TO_CANONICAL[symmetry.TRANSFORM[state]], axis=-1)
+        return np.asarray(self.qmatrix[state])
+
+
+    def choose_action(self, state, legal, explore=True):
+        """ :param state: QMatrix row index, or array of them
+            :param legal: boolean mask of the legal QMatrix columns, e.g. states.LEGAL[state]
+            :param explore: if False, choose greedily
+
+            Chooses a legal column with the agent's policy and returns it (or an array of them). With the
+            default policies.EpsilonGreedy, the action is chosen randomly with probability (1 - epsilon) 
+            when exploring, and greedily otherwise. Ties between the highest values are broken at random, 
+            so a row of equal values (such as one that is still all 0.0) gives a random legal action. """
+
+        return self.policy.select(self.qmatrix[state], legal, self, state, explore)
+
+
+    def get_legal_mask(self, game, state):
+        """ :param game: Game object
+            :param state: QMatrix row index returned by get_state for the current board
+
+            Returns a boolean mask of the legal QMatrix columns of row 'state'. For a symmetric agent the row
+            is the canonical board, so this is that board's mask rather than the game's. """
+
+        if self.symmetric:
+            return states.LEGAL[state]
+        return game.get_legal_move_mask()
+
+
+    def get_position(self, action, frame=0):
+        """ :param action: QMatrix column index
+            :param frame: symmetry returned by get_state for the current board
+
+            Returns the board position (row, col) of column 'action' of a row in the given symmetry frame. """
+
+        if frame != 0:
+            action = symmetry.FROM_CANONICAL_LIST[frame][action]
+        return (action // self.size, action % self.size)
+
+
+    def update_qmatrix(self, state, action, reward, new_state):
+        """ :param state: QMatrix row index, or array of them
+            :param action: QMatrix column index, or array of them
+            :param reward: float, or array of them
+            :param new_state: QMatrix row index the action led to, or array of them
+
+            Applies the Qlearning update to QMatrix[state][action]:
+            Q(s,a) = Q(s,a) + eta * (reward + gamma * max Q(s',:) - Q(s,a))
+            When given arrays, every (state, action) pair is updated at once with fancy indexing. The changes
+            are passed on to the agent's ConvergenceTracker. """
+
+        old_value = self.qmatrix[state, action]
+        delta = self.eta * (reward + self.gamma * np.max(self.qmatrix[new_state], axis=-1) - old_value)
+        self.qmatrix[state, action] = old_value + delta
+        self.convergence.observe(state, delta)
+
+
     def qlearning(self, game):
         """ :param game: Game object 
         
@@ -58,72 +168,56 @@ class Agent(object):
         done = False    # Keeps track of whether or not the game is finished
 
         # Gets the current state of the game
-        # 'state' is an integer used as a row index for the QMatrix
-        state = game.translate_board_state_to_index()
+        # 'state' is an integer used as a row index for the QMatrix, and 'frame' is the symmetry
+        # used to map the board onto that row (always 0 unless the agent is symmetric)
+        state, frame = self.get_state(game)
 
         # Check to see if current state is a winning state for the opponent or a draw.
         # If so, update QMatrix, set 'prev_state' and 'prev_action' to None, and set 'done' to True.
         if game.has_opponent_won() == True:
-            self.qmatrix[self.prev_state, self.prev_action] = self.qmatrix[self.prev_state, self.prev_action] + self.eta * (reward + self.gamma * np.max(self.qmatrix[state, :]) - self.qmatrix[self.prev_state, self.prev_action])
+            self.update_qmatrix(self.prev_state, self.prev_action, reward, state)
             self.prev_state = None
             self.prev_action = None
             done = True
         elif game.is_it_a_draw() == True:
             reward = 0.5
-            self.qmatrix[self.prev_state, self.prev_action] = self.qmatrix[self.prev_state, self.prev_action] + self.eta * (reward + self.gamma * np.max(self.qmatrix[state, :]) - self.qmatrix[self.prev_state, self.prev_action])
+            self.update_qmatrix(self.prev_state, self.prev_action, reward, state)
             self.prev_state = None
             self.prev_action = None
             done = True
         else:
-            # Get a list of possible next actions to take
-            # Actions will be a list of tuples of integers representing positions on the board
-            actions = game.get_possible_next_moves()
-
-            if len(actions) > 0:
-                # Translate the positions received into a list of column indices (0-8) for the QMatrix
-                indices = self.translate_actions_to_indices(actions)
-
-                # Choose an action either randomly or greedily
-                unique_vals = np.unique(self.qmatrix[state, :])
-                if random.random() < (1 - self.epsilon):
-                    action = random.choice(indices)
-                elif len(unique_vals) == 1 and unique_vals[0] == 0.0:
-                    action = random.choice(indices)
-                else:
-                    max_val = float('-inf')
-                    top_index = None
-                    for index in indices:
-                        if self.qmatrix[state][index] > max_val:
-                            max_val = self.qmatrix[state][index]
-                            top_index = index
-                    action = top_index
-        
-                # Make move and get new state
-                action_idx = indices.index(action)
-                game.make_move(actions[action_idx], self.player)
-                new_state = game.translate_board_state_to_index()
-
-                # Check to see whether agent has won or whether game is a draw.
-                # If so, update reward, update QMatrix at position [state][action],
-                # set 'prev_state' and 'prev_action' to None, and set 'done' to True
-                if game.has_agent_won() == True:
-                    reward = 1
-                    self.qmatrix[state, action] = self.qmatrix[state, action] + self.eta * (reward + self.gamma * np.max(self.qmatrix[new_state, :]) - self.qmatrix[state, action])
-                    self.prev_state = None
-                    self.prev_action = None
-                    done = True
-                elif game.is_it_a_draw() == True:
-                    reward = 0.5
-                    self.qmatrix[state, action] = self.qmatrix[state, action] + self.eta * (reward + self.gamma * np.max(self.qmatrix[new_state, :]) - self.qmatrix[state, action])
-                    self.prev_state = None
-                    self.prev_action = None
-                    done = True
-                else:
-                    # Otherwise, if game is still in progress, update QMatrix at position [state][action], and
-                    # set 'prev_state' and 'prev_action' to 'state' and 'action' 
-                    self.qmatrix[state, action] = self.qmatrix[state, action] + self.eta * (reward + self.gamma * np.max(self.qmatrix[new_state, :]) - self.qmatrix[state, action])
-                    self.prev_state = state
-                    self.prev_action = action
+            # is_it_a_draw() returned False, so there is at least one empty position to move to
+            # Choose an action either randomly or greedily
+            action = self.choose_action(state, self.get_legal_mask(game, state))
+    
+            # Make move and get new state
+            game.make_move(self.get_position(action, frame), self.player)
+            new_state, _ = self.get_state(game)
+
+            # Check to see whether agent has won or whether game is a draw.
+            # If so, update reward, update QMatrix at position [state][action],
+            # set 'prev_state' and 'prev_action' to None, and set 'done' to True
+            if game.has_agent_won() == True:
+                reward = 1
+                self.update_qmatrix(state, action, reward, new_state)
+                self.prev_state = None
+                self.prev_action = None
+                done = True
+            elif game.is_it_a_draw() == True:
+                reward = 0.5
+                self.update_qmatrix(state, action, reward, new_state)
+                self.prev_state = None
+                self.prev_action = None
+                done = True
+            else:
+                # Otherwise, if game is still in progress, update QMatrix at position [state][action], and
+                # set 'prev_state' and 'prev_action' to 'state' and 'action' 
+                self.update_qmatrix(state, action, reward, new_state)
+                self.prev_state = state
+                self.prev_action = action
+
+        if done:
+            self.training_games += 1
 
         return done
 
@@ -137,40 +231,112 @@ class Agent(object):
         action = None
         done = False
 
-        state = game.translate_board_state_to_index()
+        state, frame = self.get_state(game)
 
         if game.has_opponent_won() == True or game.is_it_a_draw() == True:
             done = True
         else:
-            actions = game.get_possible_next_moves()
-
-            if len(actions) > 0:
-                indices = self.translate_actions_to_indices(actions)
-
-                # Choose next action greedily unless all values in the current row are
-                # 0.0. In this case, choose randomly from the list of available actions.
-                unique_vals = np.unique(self.qmatrix[state, :])
-                if (len(unique_vals) == 1 and unique_vals[0] == 0.0):
-                    action = random.choice(indices)
-                else:
-                    max_val = float('-inf')
-                    top_index = None
-                    for index in indices:
-                        if self.qmatrix[state][index] > max_val:
-                            max_val = self.qmatrix[state][index]
-                            top_index = index
-                    action = top_index
-        
-                action_idx = indices.index(action)
-                game.make_move(actions[action_idx], self.player)
-                new_state = game.translate_board_state_to_index()
+            # Choose next action greedily
+            action = self.choose_action(state, self.get_legal_mask(game, state), explore=False)
+    
+            game.make_move(self.get_position(action, frame), self.player)
+            new_state, _ = self.get_state(game)
 
-                if game.has_agent_won() == True or game.is_it_a_draw() == True:
-                    done = True
+            if game.has_agent_won() == True or game.is_it_a_draw() == True:
+                done = True
 
         return done
 
 
+    def qlearning_batch(self, vecgame):
+        """ :param vecgame: VecGame object
+
+            Batched version of the Qlearning method. Chooses an action on every board of 'vecgame' at once
+            (randomly or greedily, in the same way as qlearning), plays the moves and the opponent's replies,
+            and applies the same QMatrix updates that qlearning would using fancy indexing. If several boards
+            update the same (state, action) pair in one call, only one of their updates is kept. Finished
+            boards are reset. Returns a boolean array that is True for the boards whose game finished. VecGame
+            only plays 3x3 tic-tac-toe, so this raises ValueError for an agent of any other size. """
+
+        self.check_batch_size("qlearning_batch")
+
+        state = vecgame.states.copy()
+        legal = vecgame.legal_moves()
+        if self.symmetric:
+            # Work in each board's canonical frame: legal[:, c] is whether canonical column c is legal
+            frame = symmetry.TRANSFORM[state]
+            state = symmetry.CANONICAL[state]
+            legal = np.take_along_axis(legal, symmetry.FROM_CANONICAL[frame], axis=1)
+
+        # Choose an action for each board either randomly or greedily
+        action = self.choose_action(state, legal)
+
+        # Make the moves and update the QMatrix at [state][action] on every board
+        if self.symmetric:
+            new_state, reward, done = vecgame.move(symmetry.FROM_CANONICAL[frame, action])
+            new_state = symmetry.CANONICAL[new_state]
+        else:
+            new_state, reward, done = vecgame.move(action)
+        self.update_qmatrix(state, action, reward, new_state)
+
+        # On the boards where the opponent's reply ends the game, update [state][action] again,
+        # just as qlearning does with 'prev_state' and 'prev_action' on its next call
+        new_state, reward, finished = vecgame.respond()
+        if self.symmetric:
+            new_state = symmetry.CANONICAL[new_state]
+        ended = finished & ~done
+        if np.any(ended):
+            state, action, new_state, reward = state[ended], action[ended], new_state[ended], reward[ended]
+            self.update_qmatrix(state, action, reward, new_state)
+
+        vecgame.reset_boards(finished)
+        self.training_games += int(np.count_nonzero(finished))
+        return finished
+
+
+    def play_game_batch(self, vecgame):
+        """ :param vecgame: VecGame object
+
+            Batched version of the play_game method. Chooses the greedy action on every board of 'vecgame' at
+            once (breaking ties at random, as in play_game), plays the moves and the 
+            opponent's replies and resets finished boards. No updates to the QMatrix are made. Returns a
+            boolean array that is True for the boards whose game finished. Raises ValueError for an agent
+            that is not 3x3, as qlearning_batch does. """
+
+        self.check_batch_size("play_game_batch")
+
+        state = vecgame.states
+        legal = vecgame.legal_moves()
+        if self.symmetric:
+            frame = symmetry.TRANSFORM[state]
+            state = symmetry.CANONICAL[state]
+            legal = np.take_along_axis(legal, symmetry.FROM_CANONICAL[frame], axis=1)
+
+        action = self.choose_action(state, legal, explore=False)
+        if self.symmetric:
+            action = symmetry.FROM_CANONICAL[frame, action]
+
+        vecgame.move(action)
+        _, _, finished = vecgame.respond()
+        vecgame.reset_boards(finished)
+        return finished
+
+
+    def check_batch_size(self, name, game=None):
+        """ :param name: name of the batched method or function being called
+            :param game: Game object whose games the batched ones stand in for, or None
+
+            Raises ValueError unless the agent, and 'game' if given, play 3x3 boards with three in a row to
+            win, the only game VecGame plays. """
+
+        if self.size != 3:
+            raise ValueError("{} only supports 3x3 agents (this agent has size {}); use the single-game methods "
+                             "such as qlearning, play_game and tictactoe.assess_agent instead.".format(name, self.size))
+        if game is not None and (game.size != 3 or game.win_length != 3):
+            raise ValueError("{} only plays 3x3 boards with three in a row to win (this game has size {} and win "
+                             "length {}); use the single-game methods instead.".format(name, game.size, game.win_length))
+
+
     def translate_actions_to_indices(self, actions):
         """ :param actions: list of integer tuples
         
@@ -0,0 +1,113 @@
+import numpy as np
+
+import math
+from statistics import NormalDist
+
+from vecgame import AGENT_WON, DRAW, OPPONENT_WON, VecGame
+
+###########################
+# Batched assessment of   #
+# the agent's greedy play #
+###########################
+
+
+def wilson_interval(successes, trials, confidence=0.95):
+    """ :param successes: integer
+        :param trials: integer
+        :param confidence: float between (0.0, 1.0)
+
+        Returns the (lower, upper) Wilson score interval for the proportion successes / trials.
+        Returns (0.0, 1.0) when there are no trials. """
+
+    if trials == 0:
+        return 0.0, 1.0
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / trials
+    denominator = 1 + z**2 / trials
+    centre = (p + z**2 / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z**2 / (4 * trials**2)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def summarize(wins, draws, losses, confidence=0.95):
+    """ :param wins: integer
+        :param draws: integer
+        :param losses: integer
+        :param confidence: float between (0.0, 1.0)
+
+        Returns a dictionary with the number of games, wins, draws and losses, and each rate with its
+        Wilson confidence interval, e.g. 'win_rate', 'win_rate_lower' and 'win_rate_upper'. """
+
+    games = wins + draws + losses
+    stats = {'games': games, 'wins': wins, 'draws': draws, 'losses': losses}
+    for name, count in (('win', wins), ('draw', draws), ('loss', losses)):
+        lower, upper = wilson_interval(count, games, confidence)
+        stats[name + '_rate'] = count / games if games > 0 else 0.0
+        stats[name + '_rate_lower'] = lower
+        stats[name + '_rate_upper'] = upper
+    return stats
+
+
+def count_new_games(counted, boards, agent_first, games_left):
+    """ :param counted: boolean array, True for the boards whose current game counts
+        :param boards: indices of the boards where a game has just started, in ascending order
+        :param agent_first: boolean array, True for the boards where the agent moves first
+        :param games_left: dictionary mapping agent_first to the number of games still to start
+
+        Marks the new games on 'boards' as counted, in board order, until each seat's games are used up. """
+
+    for first in (True, False):
+        new = boards[agent_first[boards] == first][:games_left[first]]
+        counted[new] = True
+        games_left[first] -= len(new)
+
+
+def assess_batch(agent, num_games, num_boards=10000, confidence=0.95, seed=None, opponent=None):
+    """ :param agent: Agent object
+        :param num_games: number of games to play
+        :param num_boards: number of games played at once
+        :param confidence: confidence level of the intervals
+        :param seed: seed for the opponent and tie-breaking, or None
+        :param opponent: Opponent object, or None for the random opponent
+
+        Plays 'num_games' games of the agent's greedy play (Agent.play_game_batch) against the random
+        opponent (or 'opponent') on a VecGame, without changing any Q-values. Half of the games are started by the agent
+        and half by the opponent. The games that count are the first ones to start in each seat, and each
+        is played to its end, so with num_boards >= num_games every board plays exactly one game. Returns a
+        dictionary with the summarize() statistics for the games where the agent moved 'first', the games
+        where it moved 'second', and 'all' of them. Raises ValueError for an agent that is not 3x3. """
+
+    agent.check_batch_size("assess_batch")
+
+    vecgame = VecGame(min(num_boards, num_games), seed=seed, opponent=opponent)
+    state = np.random.get_state()
+    if seed is not None:
+        np.random.seed(seed)
+
+    # counts[seat][outcome], where seat 0 is agent first and 1 is agent second. 'counted' marks the boards
+    # whose current game is one of the 'num_games'. Games are counted in the order they start, since
+    # counting them as they finish would favour the short ones.
+    counts = np.zeros((2, 4), dtype=np.int64)
+    games_left = {True: (num_games + 1) // 2, False: num_games // 2}
+    counted = np.zeros(vecgame.num_boards, dtype=bool)
+    count_new_games(counted, np.arange(vecgame.num_boards), vecgame.agent_first, games_left)
+    try:
+        while counted.any() or games_left[True] > 0 or games_left[False] > 0:
+            agent_first = vecgame.agent_first.copy()
+            finished = agent.play_game_batch(vecgame)
+            for first in (True, False):
+                boards = np.flatnonzero(finished & counted & (agent_first == first))
+                counts[0 if first else 1] += np.bincount(vecgame.outcomes[boards], minlength=4)
+            counted &= ~finished
+            count_new_games(counted, np.flatnonzero(finished), vecgame.agent_first, games_left)
+    finally:
+        if seed is not None:
+            np.random.set_state(state)
+
+    first = summarize(int(counts[0, AGENT_WON]), int(counts[0, DRAW]), int(counts[0, OPPONENT_WON]), confidence)
+    second = summarize(int(counts[1, AGENT_WON]), int(counts[1, DRAW]), int(counts[1, OPPONENT_WON]), confidence)
+    total = counts.sum(axis=0)
+    everything = summarize(int(total[AGENT_WON]), int(total[DRAW]), int(total[OPPONENT_WON]), confidence)
+
+    return {'first': first, 'second': second, 'all': everything}
@@ -0,0 +1,271 @@
+import numpy as np
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from agent import Agent
+from assessment import assess_batch
+from game import GAME_BACKENDS, make_game
+from kernel import train_games
+from tictactoe import assess_agent, opponent_moves, train, train_agent, train_agent_batch
+from vecgame import VecGame
+
+##########################
+# Benchmarks for the     #
+# training and play      #
+# hot paths              #
+##########################
+
+SEED = 546
+
+# Moves that take the board to a mid-game position with no winner: X at (0,0), (2,2) and O at (1,1), (0,2)
+MIDGAME_MOVES = (((0,0), 'X'), ((1,1), 'O'), ((2,2), 'X'), ((0,2), 'O'))
+
+
+def seed_everything(seed=SEED):
+    """ Seeds both the random module and numpy's global generator. """
+
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def time_per_call(func, number, repeat=5):
+    """ :param func: function taking no arguments
+        :param number: number of calls per measurement
+        :param repeat: number of measurements
+
+        Returns the best time per call in seconds over 'repeat' measurements of 'number' calls. """
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def midgame(backend):
+    """ Returns a game of the given backend with the MIDGAME_MOVES played. """
+
+    game = make_game(backend)
+    for position, player in MIDGAME_MOVES:
+        game.make_move(position, player)
+    return game
+
+
+def game_benchmarks(number):
+    """ :param number: number of calls per measurement
+
+        Times each Game method on every backend in GAME_BACKENDS. Returns a dictionary mapping
+        'game.<backend>.<method>' to seconds per call. """
+
+    results = {}
+    for backend in sorted(GAME_BACKENDS):
+        game = midgame(backend)
+        for method in ('get_possible_next_moves', 'translate_board_state_to_index', 'has_agent_won',
+                       'has_opponent_won', 'is_it_a_draw'):
+            results["game.{}.{}".format(backend, method)] = time_per_call(getattr(game, method), number)
+
+        # make_move needs an empty position, so each call also resets the board
+        fresh = make_game(backend)
+        def move_and_reset():
+            fresh.make_move((1,1), 'X')
+            fresh.reset_board()
+        results["game.{}.make_move+reset_board".format(backend)] = time_per_call(move_and_reset, number)
+
+    return results
+
+
+def agent_benchmarks(number):
+    """ :param number: number of calls per measurement
+
+        Times Agent.translate_actions_to_indices and single moves of Agent.play_game and Agent.qlearning
+        from a mid-game position. Returns a dictionary mapping names to seconds per call. """
+
+    seed_everything()
+    agent = Agent(eta=0.5, gamma=0.9, epsilon=0.5)
+    actions = midgame('table').get_possible_next_moves()
+    results = {'agent.translate_actions_to_indices': time_per_call(lambda: agent.translate_actions_to_indices(actions), number)}
+
+    game = make_game('table')
+    def play_one_move(method):
+        game.reset_board()
+        for position, player in MIDGAME_MOVES:
+            game.make_move(position, player)
+        method(game)
+        agent.prev_state = None
+        agent.prev_action = None
+
+    results['agent.play_game'] = time_per_call(lambda: play_one_move(agent.play_game), number)
+    results['agent.qlearning'] = time_per_call(lambda: play_one_move(agent.qlearning), number)
+    results['opponent_moves'] = time_per_call(lambda: play_one_move(opponent_moves), number)
+    return results
+
+
+def training_benchmarks(num_games, num_boards):
+    """ :param num_games: number of games per end-to-end measurement
+        :param num_boards: number of boards used by the batched loops
+
+        Times the end-to-end training and assessment loops. Returns a dictionary mapping names to
+        seconds per game, so that (like every other result) lower is better. """
+
+    results = {}
+
+    for backend in sorted(GAME_BACKENDS):
+        seed_everything()
+        agent = Agent(eta=0.5, gamma=0.9, epsilon=0.1)
+        game = make_game(backend)
+        player = 'X'
+        games = 0
+        start = time.perf_counter()
+        while games < num_games:
+            if train_agent(player, agent, game) == "done":
+                games += 1
+            player = 'O' if player == 'X' else 'X'
+        results["train.{}.train_agent".format(backend)] = (time.perf_counter() - start) / games
+
+    seed_everything()
+    agent = Agent(eta=0.5, gamma=0.9, epsilon=0.1)
+    start = time.perf_counter()
+    games, _ = train_games(agent, 'X', 0, num_games, num_games, 0.0)
+    results['train.kernel'] = (time.perf_counter() - start) / games
+
+    seed_everything()
+    agent = Agent(eta=0.5, gamma=0.9, epsilon=0.1)
+    vecgame = VecGame(num_boards, seed=SEED)
+    start = time.perf_counter()
+    games = train_agent_batch(agent, vecgame, num_games * 10)
+    results['train.train_agent_batch'] = (time.perf_counter() - start) / games
+
+    # Assessment of the agent trained above, which has a realistic spread of Q-values
+    game = make_game('table')
+    player = 'X'
+    rounds = max(1, num_games // 100)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        player, _ = assess_agent(player, agent, game, [])
+    results['assess.assess_agent'] = (time.perf_counter() - start) / (rounds * 10)
+
+    start = time.perf_counter()
+    stats = assess_batch(agent, num_games * 10, num_boards=num_boards, seed=SEED)
+    results['assess.assess_batch'] = (time.perf_counter() - start) / stats['all']['games']
+
+    return results
+
+
+def check_kernel(num_epochs=3, stop=2000, m=1000):
+    """ :param num_epochs: number of training epochs per run
+        :param stop: training games per epoch
+        :param m: games per epoch before epsilon is increased
+
+        Trains an agent with tictactoe.train twice on every game backend from the same seed, once with
+        kernel.train_games and once with the generic train_agent loop, and compares the results, which must
+        be identical. Returns a list of (backend, what differs) for every mismatch. """
+
+    mismatches = []
+    for backend in sorted(GAME_BACKENDS):
+        runs = []
+        for use_kernel in (True, False):
+            seed_everything()
+            agent = Agent(eta=0.5, gamma=0.9, epsilon=0.1)
+            agent.convergence.track_dirty = True
+            agent, y_axis, _ = train(agent, make_game(backend), num_epochs=num_epochs, stop=stop, m=m,
+                                     num_assessment_games=0, use_kernel=use_kernel)
+            runs.append({'qmatrix': agent.qmatrix.tobytes(),
+                         'epsilon': agent.epsilon,
+                         'training_games': agent.training_games,
+                         'prev_state': (agent.prev_state, agent.prev_action),
+                         'convergence': agent.convergence.summary(),
+                         'dirty_rows': agent.convergence.take_dirty().tolist(),
+                         'assessments': y_axis,
+                         'random_state': (random.getstate(), np.random.randint(2**31))})
+        for name in runs[0]:
+            if runs[0][name] != runs[1][name]:
+                mismatches.append((backend, name))
+    return mismatches
+
+
+def run_benchmarks(quick=False):
+    """ :param quick: if True, use fewer iterations (for a fast smoke test)
+
+        Runs every benchmark with fixed seeds and returns a JSON-serializable dictionary holding
+        the results (seconds per call or per game) along with details of the machine. """
+
+    number = 2000 if quick else 20000
+    num_games = 500 if quick else 5000
+
+    results = {}
+    results.update(game_benchmarks(number))
+    results.update(agent_benchmarks(number // 10))
+    results.update(training_benchmarks(num_games, num_boards=1000))
+
+    return {'machine': platform.node(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'seed': SEED,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'results': results}
+
+
+def compare(current, baseline, threshold):
+    """ :param current: dictionary returned by run_benchmarks
+        :param baseline: dictionary returned by an earlier run_benchmarks
+        :param threshold: allowed slowdown as a fraction, e.g. 0.25 for 25%
+
+        Returns a list of (name, baseline seconds, current seconds) for every benchmark that is
+        slower than its baseline by more than 'threshold'. Benchmarks missing from either run are
+        skipped. """
+
+    regressions = []
+    for name, seconds in sorted(current['results'].items()):
+        previous = baseline['results'].get(name)
+        if previous is not None and seconds > previous * (1 + threshold):
+            regressions.append((name, previous, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tic-tac-toe training and play hot paths.")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="JSON file from an earlier run on the same machine to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="fail if a benchmark is slower than the baseline by more than this fraction (default 0.25)")
+    parser.add_argument('--quick', action='store_true', help="use fewer iterations")
+    args = parser.parse_args()
+
+    # The kernel is only a faster way to run the training loop, so any difference is a bug
+    mismatches = check_kernel()
+    for backend, name in mismatches:
+        print("MISMATCH kernel.train_games and train_agent on the '{}' backend differ in {}".format(backend, name))
+    if mismatches:
+        sys.exit(1)
+
+    current = run_benchmarks(quick=args.quick)
+    for name, seconds in sorted(current['results'].items()):
+        print("{:<50} {:>12.3f} us".format(name, seconds * 1e6))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = compare(current, baseline, args.threshold)
+        for name, previous, seconds in regressions:
+            print("REGRESSION {}: {:.3f} us -> {:.3f} us ({:+.0%})".format(
+                  name, previous * 1e6, seconds * 1e6, seconds / previous - 1))
+        if regressions:
+            sys.exit(1)
+        print("No benchmark is more than {:.0%} slower than the baseline.".format(args.threshold))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import numpy as np
+
+import json
+import os
+
+from agent import Agent
+from qtable import CompactQMatrix, SparseQMatrix
+
+##########################
+# Saving and loading     #
+# trained agents         #
+##########################
+
+# A checkpoint is a directory holding two files:
+#   qvalues-<id>.npy  the Q-values as a plain .npy array (the dense QMatrix, or CompactQMatrix.values),
+#                     so that it can be memory-mapped when loading. Each save writes a new file.
+#   meta.json         FORMAT_VERSION, the name of the Q-values file, the agent's settings and
+#                     hyperparameters, its training counters and any extra training state (e.g. the
+#                     epoch and assessment results from main)
+# Checkpoints written before the Q-values file name was stored use QVALUES_FILE.
+
+FORMAT_VERSION = 1
+QVALUES_FILE = "qvalues.npy"
+META_FILE = "meta.json"
+
+
+def save_agent(agent, path, **training_state):
+    """ :param agent: Agent object
+        :param path: checkpoint directory, created if it does not exist
+        :param training_state: extra JSON-serializable values to store, e.g. epoch=3
+
+        Writes the agent's Q-values, eta, gamma, epsilon and training counters to 'path'. The Q-values go
+        to a new file, and meta.json, which names that file, is written under a temporary name and then
+        renamed into place. That rename switches to the new Q-values and training state together, so an
+        interrupted save leaves the previous checkpoint as it was. Processes that have the old Q-values
+        memory-mapped keep them. Raises ValueError for an agent with a SparseQMatrix, which has no single
+        array to save. """
+
+    if isinstance(agent.qmatrix, SparseQMatrix):
+        raise ValueError("Agents with a SparseQMatrix cannot be saved as a checkpoint.")
+
+    os.makedirs(path, exist_ok=True)
+    compact = isinstance(agent.qmatrix, CompactQMatrix)
+    values = agent.qmatrix.values if compact else agent.qmatrix
+    qvalues_file = "qvalues-{}.npy".format(os.urandom(8).hex())
+
+    meta = {'format_version': FORMAT_VERSION,
+            'eta': agent.eta,
+            'gamma': agent.gamma,
+            'epsilon': agent.epsilon,
+            'compact': compact,
+            'symmetric': agent.symmetric,
+            'dtype': str(values.dtype),
+            'shape': list(values.shape),
+            'qvalues_file': qvalues_file,
+            'training_games': agent.training_games,
+            'training_state': training_state}
+
+    with open(os.path.join(path, qvalues_file), "xb") as f:
+        np.save(f, np.ascontiguousarray(values))
+
+    tmp_meta = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_meta, os.path.join(path, META_FILE))
+
+    # Remove the Q-values of earlier saves, and of saves interrupted before their meta.json was written
+    for name in os.listdir(path):
+        if name.startswith("qvalues") and name.endswith(".npy") and name != qvalues_file:
+            os.remove(os.path.join(path, name))
+
+
+def load_agent(path, mmap=True, writable=False):
+    """ :param path: checkpoint directory written by save_agent
+        :param mmap: if True, memory-map the Q-values instead of reading them into memory
+        :param writable: if True, the agent can keep training. With 'mmap', pages are copied on
+                         write, so the checkpoint file itself is never changed.
+
+        Returns the Agent stored in 'path' and the dictionary of extra training state passed to
+        save_agent. With 'mmap' and not 'writable', the QMatrix is a read-only view of the file that
+        processes loading the same checkpoint share through the page cache, so loading takes about
+        as long as opening the file. Raises ValueError if the checkpoint has an unsupported version. """
+
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+
+    if meta.get('format_version') != FORMAT_VERSION:
+        raise ValueError("Unsupported checkpoint format version {} in '{}' (expected {}).".format(
+                         meta.get('format_version'), path, FORMAT_VERSION))
+
+    qvalues_path = os.path.join(path, meta.get('qvalues_file') or QVALUES_FILE)
+    if mmap:
+        values = np.load(qvalues_path, mmap_mode='c' if writable else 'r')
+    else:
+        values = np.load(qvalues_path)
+        values.setflags(write=writable)
+
+    if list(values.shape) != meta['shape'] or str(values.dtype) != meta['dtype']:
+        raise ValueError("Q-values in '{}' do not match its {}.".format(path, META_FILE))
+
+    agent = Agent(meta['eta'], meta['gamma'], meta['epsilon'], compact=meta['compact'], symmetric=meta['symmetric'])
+    if meta['compact']:
+        agent.qmatrix.values = values
+    else:
+        agent.qmatrix = values
+    agent.training_games = meta['training_games']
+
+    return agent, meta['training_state']
@@ -0,0 +1,158 @@
+import numpy as np
+
+import argparse
+import json
+import random
+import sys
+
+from agent import Agent
+from assessment import assess_batch
+from convergence import EarlyStopping
+from deltalog import load_checkpoint
+from game import GAME_BACKENDS, make_game
+from metrics import MetricsWriter
+from opponents import GreedyOpponent, MinimaxOpponent
+from tictactoe import play_against_user, plot_assessments, train
+
+##########################
+# Command line interface #
+##########################
+
+OPPONENTS = {'random': lambda epsilon, seed: None,
+             'greedy': lambda epsilon, seed: GreedyOpponent(epsilon, seed),
+             'minimax': lambda epsilon, seed: MinimaxOpponent(epsilon, seed)}
+
+
+def seed_everything(seed):
+    """ Seeds both the random module and numpy's global generator, unless 'seed' is None. """
+
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+
+
+def train_command(args):
+    seed_everything(args.seed)
+    agent = Agent(eta=args.eta, gamma=args.gamma, epsilon=args.epsilon, compact=args.compact, symmetric=args.symmetric)
+    game = make_game(args.backend)
+    opponent = OPPONENTS[args.opponent](args.opponent_epsilon, args.seed)
+
+    early_stopping = None
+    if args.stop_tolerance is not None:
+        early_stopping = EarlyStopping(args.stop_tolerance, criterion=args.stop_criterion, patience=args.stop_patience,
+                                       min_epochs=args.min_epochs)
+
+    metrics = MetricsWriter(args.metrics) if args.metrics else None
+    try:
+        agent, y_axis, assessments = train(agent, game, num_epochs=args.epochs, stop=args.games,
+                                           epsilon_increase=args.epsilon_increase, m=args.m,
+                                           num_boards=args.boards, checkpoint_path=args.checkpoint,
+                                           checkpoint_every=args.checkpoint_every,
+                                           delta_checkpoints=args.delta_checkpoints,
+                                           num_assessment_games=args.assessment_games, metrics=metrics,
+                                           instrument_path=args.instrument, profile_epoch=args.profile_epoch,
+                                           profile_path=args.profile_path, profile_top=args.profile_top,
+                                           early_stopping=early_stopping, opponent=opponent,
+                                           seed=args.seed)
+    finally:
+        if metrics is not None:
+            metrics.close()
+
+    if assessments:
+        print("Win rate after training: {:.4f}".format(assessments[-1]['all']['win_rate']))
+    elif y_axis:
+        print("Wins out of 10 after training: {}".format(y_axis[-1]))
+    if args.plot:
+        plot_assessments(y_axis, assessments)
+
+
+def assess_command(args):
+    agent, _ = load_checkpoint(args.checkpoint)
+    opponent = OPPONENTS[args.opponent](args.opponent_epsilon, args.seed)
+    stats = assess_batch(agent, args.games, seed=args.seed, opponent=opponent)
+
+    if args.json:
+        print(json.dumps(stats))
+    else:
+        for name in ('first', 'second', 'all'):
+            s = stats[name]
+            print("{:<7} games {:>8}  win {:.4f} [{:.4f}, {:.4f}]  draw {:.4f}  loss {:.4f}".format(
+                  name, s['games'], s['win_rate'], s['win_rate_lower'], s['win_rate_upper'], s['draw_rate'], s['loss_rate']))
+
+
+def play_command(args):
+    agent, _ = load_checkpoint(args.checkpoint)
+    play_against_user(agent, make_game(args.backend))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Train, assess and play against the tic-tac-toe Q-learning agent.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help="train an agent, resuming from its checkpoint if there is one")
+    train_parser.add_argument('--eta', type=float, default=0.5, help="learning rate (default 0.5)")
+    train_parser.add_argument('--gamma', type=float, default=0.9, help="discount (default 0.9)")
+    train_parser.add_argument('--epsilon', type=float, default=0.1,
+                              help="initial probability of acting greedily (default 0.1)")
+    train_parser.add_argument('--epsilon-increase', type=float, default=0.05,
+                              help="increase in epsilon after --m games and before the last game of each epoch")
+    train_parser.add_argument('--m', type=int, default=5000, help="games per epoch before epsilon is increased")
+    train_parser.add_argument('--epochs', type=int, default=10)
+    train_parser.add_argument('--games', type=int, default=10000, help="training games per epoch")
+    train_parser.add_argument('--boards', type=int, default=0,
+                              help="train on this many boards at once with a VecGame (default 0, one game at a time)")
+    train_parser.add_argument('--backend', choices=sorted(GAME_BACKENDS), default='table')
+    train_parser.add_argument('--compact', action='store_true', help="store the QMatrix as a CompactQMatrix")
+    train_parser.add_argument('--symmetric', action='store_true', help="share QMatrix rows between symmetric boards")
+    train_parser.add_argument('--opponent', choices=sorted(OPPONENTS), default='random',
+                              help="opponent to train against (default random); assessments are always against random")
+    train_parser.add_argument('--opponent-epsilon', type=float, default=0.0,
+                              help="probability of a random move by a greedy or minimax opponent")
+    train_parser.add_argument('--checkpoint', default=None, help="checkpoint directory (default: no checkpoints)")
+    train_parser.add_argument('--checkpoint-every', type=int, default=1)
+    train_parser.add_argument('--delta-checkpoints', action='store_true',
+                              help="keep --checkpoint as a delta log of the rows changed each epoch (see deltalog.py)")
+    train_parser.add_argument('--assessment-games', type=int, default=10000,
+                              help="games per batched assessment; 0 assesses with 10 games of assess_agent")
+    train_parser.add_argument('--metrics', help="stream per-epoch metrics to this file (.csv, or JSON lines otherwise)")
+    train_parser.add_argument('--instrument', help="write per-epoch timings and counters to this JSON lines file")
+    train_parser.add_argument('--profile-epoch', type=int, help="run this epoch (starting from 1) under cProfile")
+    train_parser.add_argument('--profile-path', help="file to save the profile to (default: epoch_<N>.prof)")
+    train_parser.add_argument('--profile-top', type=int, default=0,
+                              help="print this many of the most expensive functions of the profile (default 0)")
+    train_parser.add_argument('--stop-tolerance', type=float,
+                              help="stop once |delta Q| over an epoch is below this (default: never stop early)")
+    train_parser.add_argument('--stop-criterion', choices=('mean', 'max'), default='mean',
+                              help="statistic of |delta Q| compared with --stop-tolerance (default mean)")
+    train_parser.add_argument('--stop-patience', type=int, default=1,
+                              help="number of epochs in a row that must meet --stop-tolerance (default 1)")
+    train_parser.add_argument('--min-epochs', type=int, default=1, help="never stop before this many epochs")
+    train_parser.add_argument('--plot', action='store_true', help="plot the agent's progress (needs matplotlib)")
+    train_parser.add_argument('--seed', type=int, help="seed for the random module, numpy and the batched games")
+    train_parser.set_defaults(func=train_command)
+
+    assess_parser = subparsers.add_parser('assess', help="assess a saved agent's greedy play")
+    assess_parser.add_argument('--checkpoint', default="agent_checkpoint")
+    assess_parser.add_argument('--games', type=int, default=100000)
+    assess_parser.add_argument('--opponent', choices=sorted(OPPONENTS), default='random')
+    assess_parser.add_argument('--opponent-epsilon', type=float, default=0.0,
+                               help="probability of a random move by a greedy or minimax opponent")
+    assess_parser.add_argument('--seed', type=int)
+    assess_parser.add_argument('--json', action='store_true', help="print the statistics as JSON")
+    assess_parser.set_defaults(func=assess_command)
+
+    play_parser = subparsers.add_parser('play', help="play 10 games against a saved agent")
+    play_parser.add_argument('--checkpoint', default="agent_checkpoint")
+    play_parser.add_argument('--backend', choices=sorted(GAME_BACKENDS), default='table')
+    play_parser.set_defaults(func=play_command)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,115 @@
+import numpy as np
+
+##########################
+# Convergence tracking   #
+# and early stopping     #
+##########################
+
+
+class ConvergenceTracker(object):
+
+    def __init__(self):
+        """ Accumulates the size of the Q-value changes made by Agent.update_qmatrix, as they are made, so
+            that convergence can be judged without scanning or copying the QMatrix. summary() reports on
+            the updates since the last reset(), e.g. over one epoch. While 'track_dirty' is True, which a
+            deltalog.DeltaLog sets on the agents it checkpoints, it also keeps the rows changed since the
+            last take_dirty(), across resets. Otherwise the set would grow with every row ever updated. """
+
+        self.track_dirty = False
+        self.dirty = set()
+        self.reset()
+
+
+    def reset(self):
+        """ Starts a new window. """
+
+        self.updates = 0
+        self.abs_sum = 0.0
+        self.max_abs = 0.0
+        self.rows = set()
+
+
+    def observe(self, state, delta):
+        """ :param state: QMatrix row index updated, or array of them
+            :param delta: change made to the Q-value, or array of them """
+
+        if np.ndim(delta) == 0:
+            delta = abs(delta)
+            self.updates += 1
+            self.abs_sum += delta
+            if delta > self.max_abs:
+                self.max_abs = delta
+            self.rows.add(state)
+            if self.track_dirty:
+                self.dirty.add(state)
+        elif len(delta) > 0:
+            delta = np.abs(delta)
+            self.updates += len(delta)
+            self.abs_sum += float(delta.sum())
+            self.max_abs = max(self.max_abs, float(delta.max()))
+            state = np.asarray(state).tolist()
+            self.rows.update(state)
+            if self.track_dirty:
+                self.dirty.update(state)
+
+
+    def mark_dirty(self, rows):
+        """ :param rows: array of QMatrix row indices
+
+            Records rows that were changed without going through observe(), e.g. by value iteration. """
+
+        if self.track_dirty:
+            self.dirty.update(np.asarray(rows).tolist())
+
+
+    def take_dirty(self):
+        """ Returns a sorted array of the rows changed since the last call (none unless 'track_dirty' is
+            True) and starts a new set. """
+
+        rows = np.array(sorted(self.dirty), dtype=np.int64)
+        self.dirty = set()
+        return rows
+
+
+    def summary(self):
+        """ Returns a dictionary with the number of 'updates' in the window, the 'mean_abs_delta' and
+            'max_abs_delta' of the Q-value changes and the number of distinct 'rows_touched'. """
+
+        return {'updates': self.updates,
+                'mean_abs_delta': float(self.abs_sum / self.updates) if self.updates > 0 else 0.0,
+                'max_abs_delta': float(self.max_abs),
+                'rows_touched': len(self.rows)}
+
+
+class EarlyStopping(object):
+
+    def __init__(self, tolerance, criterion='mean', patience=1, min_epochs=1):
+        """ :param tolerance: training has converged once the criterion is below this
+            :param criterion: 'mean' or 'max', the statistic of |delta Q| over an epoch to test
+            :param patience: number of epochs in a row the criterion must hold
+            :param min_epochs: never stop before this many epochs
+
+            Decides when to stop training from the ConvergenceTracker summary of each epoch. """
+
+        if criterion not in ('mean', 'max'):
+            raise ValueError("Unknown convergence criterion '{}'. Choose 'mean' or 'max'.".format(criterion))
+
+        self.tolerance = tolerance
+        self.key = criterion + '_abs_delta'
+        self.patience = patience
+        self.min_epochs = min_epochs
+        self.epochs = 0
+        self.streak = 0     # Epochs in a row that met the criterion
+
+
+    def update(self, summary):
+        """ :param summary: dictionary returned by ConvergenceTracker.summary() for an epoch
+
+            Returns True if training should stop after this epoch. """
+
+        self.epochs += 1
+        if summary[self.key] < self.tolerance:
+            self.streak += 1
+        else:
+            self.streak = 0
+        return self.epochs >= self.min_epochs and self.streak >= self.patience
@@ -0,0 +1,303 @@
+import numpy as np
+
+import argparse
+import json
+import os
+import re
+import shutil
+import struct
+
+from checkpoint import META_FILE, load_agent, save_agent
+from qtable import DENSE_INDEX, CompactQMatrix
+
+##########################
+# Append-only log of     #
+# QMatrix row deltas     #
+##########################
+
+# A delta log is a directory holding full snapshots and, for each snapshot, a log of the rows changed
+# after it:
+#   snapshot-<epoch>/   a checkpoint written by checkpoint.save_agent for that epoch
+#   deltas-<epoch>.bin  the deltas recorded on top of snapshot-<epoch>: an 8-byte HEADER, then one
+#                       record per later epoch
+# A record is the DELTA_RECORD header (epoch, number of rows, length of the metadata), the indices of
+# the changed rows of the Q-value array as int32, those rows (9 values each, in the snapshot's dtype)
+# and the metadata as JSON: the agent's epsilon and training_games and the training state passed to
+# append(). Records are only ever appended. A record cut short by an interruption is dropped the next
+# time the log is opened for appending.
+
+MAGIC = b"TTTQDLT"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<7sB")
+DELTA_RECORD = struct.Struct("<III")
+
+SNAPSHOT_PATTERN = re.compile(r"^snapshot-(\d+)$")
+
+
+def snapshot_dir(path, epoch):
+    return os.path.join(path, "snapshot-{:06d}".format(epoch))
+
+
+def deltas_file(path, epoch):
+    return os.path.join(path, "deltas-{:06d}.bin".format(epoch))
+
+
+def qvalues(agent):
+    """ Returns the agent's array of Q-values: the dense QMatrix, or CompactQMatrix.values. """
+
+    return agent.qmatrix.values if isinstance(agent.qmatrix, CompactQMatrix) else agent.qmatrix
+
+
+def read_deltas(path, dtype):
+    """ :param path: deltas file
+        :param dtype: dtype of the Q-values of its snapshot
+
+        Generator yielding (epoch, rows, values, metadata, end offset) for each complete record of 'path'.
+        The arrays are read-only views of the record's bytes. Raises ValueError if the file is not a delta
+        log or has an unsupported version. """
+
+    row_bytes = 9 * np.dtype(dtype).itemsize
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if len(data) < HEADER.size:
+        return
+    magic, version = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("'{}' is not a delta log.".format(path))
+    if version != FORMAT_VERSION:
+        raise ValueError("Unsupported delta log version {} in '{}' (expected {}).".format(version, path, FORMAT_VERSION))
+
+    offset = HEADER.size
+    while offset + DELTA_RECORD.size <= len(data):
+        epoch, num_rows, meta_length = DELTA_RECORD.unpack_from(data, offset)
+        start = offset + DELTA_RECORD.size
+        end = start + num_rows * (4 + row_bytes) + meta_length
+        if end > len(data):
+            return
+
+        rows = np.frombuffer(data, dtype=np.int32, count=num_rows, offset=start)
+        values = np.frombuffer(data, dtype=dtype, count=9 * num_rows, offset=start + 4 * num_rows).reshape(num_rows, 9)
+        metadata = json.loads(data[end - meta_length:end].decode())
+        yield epoch, rows, values, metadata, end
+        offset = end
+
+
+def is_delta_log(path):
+    """ Returns True if 'path' is a directory holding a delta log rather than an ordinary checkpoint. """
+
+    return os.path.isdir(path) and any(SNAPSHOT_PATTERN.match(name) for name in os.listdir(path))
+
+
+def load_checkpoint(path, mmap=True, writable=False):
+    """ :param path: checkpoint directory written by checkpoint.save_agent, or a delta log
+        :param mmap: as for checkpoint.load_agent
+        :param writable: as for checkpoint.load_agent
+
+        Loads an agent from either kind of checkpoint, restoring the latest epoch of a delta log. A restored
+        agent is always a writable copy in memory, never a memory map. Returns the agent and its training
+        state, as load_agent does. """
+
+    if is_delta_log(path):
+        return DeltaLog(path).restore()
+    return load_agent(path, mmap=mmap, writable=writable)
+
+
+class DeltaLog(object):
+
+    def __init__(self, path):
+        """ :param path: directory of the log, created if it does not exist
+
+            Checkpoints an agent every epoch by writing only the QMatrix rows changed since the previous
+            checkpoint, as tracked by agent.convergence (see ConvergenceTracker.take_dirty), so a checkpoint
+            costs time and disk space in proportion to the rows an epoch touched instead of the whole
+            QMatrix. restore() rebuilds the agent at any recorded epoch by loading the snapshot before it
+            and applying the deltas up to it, and compact() folds the deltas into a new snapshot. """
+
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+
+    def snapshots(self):
+        """ Returns the sorted epochs of the complete snapshots in the log. """
+
+        epochs = []
+        for name in os.listdir(self.path):
+            match = SNAPSHOT_PATTERN.match(name)
+            if match and os.path.exists(os.path.join(self.path, name, META_FILE)):
+                epochs.append(int(match.group(1)))
+        return sorted(epochs)
+
+
+    def epochs(self):
+        """ Returns the sorted epochs that can be restored. """
+
+        epochs = set()
+        for snapshot in self.snapshots():
+            epochs.add(snapshot)
+            dtype = self._dtype(snapshot)
+            if os.path.exists(deltas_file(self.path, snapshot)):
+                epochs.update(epoch for epoch, _, _, _, _ in read_deltas(deltas_file(self.path, snapshot), dtype))
+        return sorted(epochs)
+
+
+    def append(self, agent, epoch, training_state=None):
+        """ :param agent: Agent object with a dense or compact QMatrix
+            :param epoch: epoch that has just finished, later than every epoch in the log
+            :param training_state: dictionary of extra JSON-serializable values to store, as for save_agent
+
+            Records the agent's state after 'epoch'. The first call writes a full snapshot, and later calls
+            append the rows changed since the previous call to the deltas of the latest snapshot. Either
+            way, the agent's dirty rows are cleared and tracked from then on. Raises ValueError if 'epoch' is not later than the
+            last epoch in the log. """
+
+        training_state = {} if training_state is None else training_state
+        agent.convergence.track_dirty = True
+        snapshots = self.snapshots()
+        if not snapshots:
+            agent.convergence.take_dirty()
+            self._snapshot(agent, epoch, training_state)
+            return
+
+        latest = snapshots[-1]
+        values = qvalues(agent)
+        path = deltas_file(self.path, latest)
+        last_epoch = self._truncate_partial_record(path, values.dtype, latest)
+        if epoch <= last_epoch:
+            raise ValueError("Cannot append epoch {} to the delta log in '{}', which already has epoch {}.".format(
+                             epoch, self.path, last_epoch))
+
+        rows = agent.convergence.take_dirty()
+        if isinstance(agent.qmatrix, CompactQMatrix):
+            rows = DENSE_INDEX[rows]
+        rows = rows.astype(np.int32)
+        metadata = json.dumps({'epsilon': agent.epsilon,
+                               'training_games': agent.training_games,
+                               'training_state': training_state}).encode()
+
+        with open(path, "ab") as f:
+            if f.tell() == 0:
+                f.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+            f.write(DELTA_RECORD.pack(epoch, len(rows), len(metadata)))
+            f.write(rows.tobytes())
+            f.write(np.ascontiguousarray(values[rows]).tobytes())
+            f.write(metadata)
+
+
+    def restore(self, epoch=None):
+        """ :param epoch: epoch to restore, or None for the latest
+
+            Returns a writable Agent with the Q-values, epsilon and training_games it had after 'epoch', and the
+            training state stored with it. The agent tracks its dirty rows, ready for the next append().
+            Raises ValueError if the epoch is not in the log. """
+
+        epochs = self.epochs()
+        if epoch is None:
+            if not epochs:
+                raise ValueError("The delta log in '{}' is empty.".format(self.path))
+            epoch = epochs[-1]
+        if epoch not in epochs:
+            raise ValueError("Epoch {} is not in the delta log in '{}'.".format(epoch, self.path))
+
+        snapshot = max(s for s in self.snapshots() if s <= epoch)
+        agent, training_state = load_agent(snapshot_dir(self.path, snapshot), mmap=False, writable=True)
+        agent.convergence.track_dirty = True
+        if epoch == snapshot:
+            return agent, training_state
+
+        values = qvalues(agent)
+        for record_epoch, rows, row_values, metadata, _ in read_deltas(deltas_file(self.path, snapshot), values.dtype):
+            if record_epoch > epoch:
+                break
+            values[rows] = row_values
+            agent.epsilon = metadata['epsilon']
+            agent.training_games = metadata['training_games']
+            training_state = metadata['training_state']
+        return agent, training_state
+
+
+    def compact(self, keep_history=False):
+        """ :param keep_history: if False, remove the snapshots and deltas before the new snapshot
+
+            Writes a full snapshot of the latest epoch, so that restoring it no longer reads any deltas and
+            later epochs are appended after it. Without 'keep_history', earlier epochs can no longer be
+            restored. Returns the epoch of the new snapshot. """
+
+        epoch = self.epochs()[-1] if self.snapshots() else None
+        if epoch is None:
+            raise ValueError("The delta log in '{}' is empty.".format(self.path))
+        agent, training_state = self.restore(epoch)
+        if epoch not in self.snapshots():
+            self._snapshot(agent, epoch, training_state)
+
+        if not keep_history:
+            for snapshot in self.snapshots():
+                if snapshot < epoch:
+                    shutil.rmtree(snapshot_dir(self.path, snapshot))
+                    if os.path.exists(deltas_file(self.path, snapshot)):
+                        os.remove(deltas_file(self.path, snapshot))
+        return epoch
+
+
+    def _snapshot(self, agent, epoch, training_state):
+        save_agent(agent, snapshot_dir(self.path, epoch), **training_state)
+        path = deltas_file(self.path, epoch)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+    def _dtype(self, snapshot):
+        with open(os.path.join(snapshot_dir(self.path, snapshot), META_FILE)) as f:
+            return np.dtype(json.load(f)['dtype'])
+
+
+    def _truncate_partial_record(self, path, dtype, snapshot):
+        """ Cuts off a record of the deltas file 'path' left incomplete by an interrupted append, so new
+            records follow the last complete one. Returns the last epoch recorded on top of 'snapshot'. """
+
+        last_epoch = snapshot
+        if not os.path.exists(path):
+            return last_epoch
+        end = HEADER.size
+        for last_epoch, _, _, _, end in read_deltas(path, dtype):
+            pass
+        if os.path.getsize(path) > end:
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        return last_epoch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, compact and export delta-log checkpoints.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    info_parser = subparsers.add_parser('info', help="list the snapshots and the epochs that can be restored")
+    info_parser.add_argument('path')
+
+    compact_parser = subparsers.add_parser('compact', help="fold the deltas into a snapshot of the latest epoch")
+    compact_parser.add_argument('path')
+    compact_parser.add_argument('--keep-history', action='store_true', help="keep the earlier snapshots and deltas")
+
+    export_parser = subparsers.add_parser('export', help="restore an epoch as an ordinary checkpoint")
+    export_parser.add_argument('path')
+    export_parser.add_argument('output', help="checkpoint directory to write")
+    export_parser.add_argument('--epoch', type=int, help="epoch to export (default: the latest)")
+    args = parser.parse_args()
+
+    log = DeltaLog(args.path)
+    if args.command == 'info':
+        for snapshot in log.snapshots():
+            path = deltas_file(args.path, snapshot)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            print("snapshot {} with {} bytes of deltas".format(snapshot, size))
+        print("Epochs: {}".format(" ".join(str(epoch) for epoch in log.epochs())))
+    elif args.command == 'compact':
+        print("Compacted to a snapshot of epoch {}.".format(log.compact(args.keep_history)))
+    else:
+        agent, training_state = log.restore(args.epoch)
+        save_agent(agent, args.output, **training_state)
+        print("Wrote the agent to '{}'.".format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+import numpy as np
+
+import os
+import struct
+
+import symmetry
+from replay import replay_update
+
+##########################
+# Recording played games #
+# to binary files        #
+##########################
+
+# An episode file starts with a short header (MAGIC and FORMAT_VERSION) followed by fixed-width, packed,
+# little-endian records of 10 bytes each:
+#   state   uint32   base-3 index of the board before the move (or the final board, see below)
+#   action  int8     cell moved into (size*row + col), or -1 for the record that ends an episode
+#   player  uint8    1 for 'X' (the agent), 2 for 'O', 0 for the record that ends an episode
+#   reward  float32  0.0 for moves. For the end record, the agent's reward for the game as in
+#                    Agent.qlearning: 1.0 for a win, 0.5 for a draw, 0.0 for a loss, NaN if the board
+#                    was reset before the game finished.
+# The uint32 state covers boards up to 4x4.
+MAGIC = b"TTTEPIS"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<7sB")
+RECORD = struct.Struct("<IbBf")
+RECORD_DTYPE = np.dtype([('state', '<u4'), ('action', 'i1'), ('player', 'u1'), ('reward', '<f4')])
+
+PLAYER_CODES = {'X': 1, 'O': 2}
+
+
+class EpisodeRecorder(object):
+
+    def __init__(self, path, chunk_records=65536):
+        """ :param path: episode file to append to, created if it does not exist
+            :param chunk_records: number of records buffered in memory between writes
+
+            Streams moves to 'path' in the format described above. Records are packed into a preallocated
+            buffer and written out a whole chunk at a time, so recording a move costs one struct.pack_into
+            call. Call close() (or use the recorder in a 'with' block) to write the last chunk. """
+
+        self.path = path
+        self.chunk_records = chunk_records
+        self.buffer = bytearray(chunk_records * RECORD.size)
+        self.count = 0          # Records in the buffer
+        self.moves = 0          # Moves recorded
+        self.episodes = 0       # Episodes recorded
+
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab")
+        if new_file:
+            self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+        else:
+            check_header(path)
+
+
+    def record_move(self, state, action, player):
+        """ :param state: base-3 index of the board before the move
+            :param action: cell moved into
+            :param player: 'X' or 'O' """
+
+        RECORD.pack_into(self.buffer, self.count * RECORD.size, state, action, PLAYER_CODES[player], 0.0)
+        self.moves += 1
+        self._advance()
+
+
+    def end_episode(self, state, reward):
+        """ :param state: base-3 index of the final board
+            :param reward: the agent's reward for the game (see above) """
+
+        RECORD.pack_into(self.buffer, self.count * RECORD.size, state, -1, 0, reward)
+        self.episodes += 1
+        self._advance()
+
+
+    def flush(self):
+        """ Writes the buffered records to the file. """
+
+        if self.count > 0:
+            self.file.write(memoryview(self.buffer)[:self.count * RECORD.size])
+            self.count = 0
+        self.file.flush()
+
+
+    def close(self):
+        """ Writes the buffered records and closes the file. """
+
+        self.flush()
+        self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def _advance(self):
+        self.count += 1
+        if self.count == self.chunk_records:
+            self.flush()
+
+
+def game_reward(game):
+    """ Returns the agent's reward for the game on 'game' (1.0, 0.5 or 0.0), or NaN if it is not finished. """
+
+    if game.has_agent_won():
+        return 1.0
+    elif game.has_opponent_won():
+        return 0.0
+    elif game.is_it_a_draw():
+        return 0.5
+    return float('nan')
+
+
+class RecordingGame(object):
+
+    def __init__(self, game, recorder):
+        """ :param game: Game object of any backend
+            :param recorder: EpisodeRecorder object
+
+            Wraps 'game' so that every move made on it is recorded, and every reset_board() after at least
+            one move ends an episode. It can be passed anywhere a Game is used (train_agent, assess_agent,
+            play_against_user); every other attribute is looked up on the wrapped game. """
+
+        self.game = game
+        self.recorder = recorder
+        self.size = game.size
+        self.moves_made = 0     # Moves made since the last reset
+
+        # Bind the methods called on every move directly, rather than going through __getattr__
+        self.translate_board_state_to_index = game.translate_board_state_to_index
+        self.get_possible_next_moves = game.get_possible_next_moves
+        self.get_legal_move_mask = game.get_legal_move_mask
+        self.has_agent_won = game.has_agent_won
+        self.has_opponent_won = game.has_opponent_won
+        self.is_it_a_draw = game.is_it_a_draw
+
+
+    def make_move(self, position, player):
+        """ Same as Game.make_move, recording the move if it is made. """
+
+        state = self.translate_board_state_to_index()
+        move_made = self.game.make_move(position, player)
+        if move_made:
+            self.recorder.record_move(state, position[0] * self.size + position[1], player)
+            self.moves_made += 1
+        return move_made
+
+
+    def reset_board(self):
+        """ Same as Game.reset_board, ending the episode first if any moves were made. """
+
+        if self.moves_made > 0:
+            self.recorder.end_episode(self.game.translate_board_state_to_index(), game_reward(self.game))
+            self.moves_made = 0
+        self.game.reset_board()
+
+
+    def __getattr__(self, name):
+        return getattr(self.game, name)
+
+
+def check_header(path):
+    """ Raises ValueError if 'path' does not start with a valid episode file header. """
+
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size or HEADER.unpack(header)[0] != MAGIC:
+        raise ValueError("'{}' is not an episode file.".format(path))
+    version = HEADER.unpack(header)[1]
+    if version != FORMAT_VERSION:
+        raise ValueError("Unsupported episode file format version {} in '{}' (expected {}).".format(
+                         version, path, FORMAT_VERSION))
+
+
+def read_records(path, chunk_records=1 << 20):
+    """ :param path: episode file written by EpisodeRecorder
+        :param chunk_records: number of records per chunk
+
+        Generator over the records of 'path', yielding them as structured arrays of RECORD_DTYPE of up
+        to 'chunk_records' records each. The file is memory-mapped, so only the chunks being used are read
+        into memory. A partly written record at the end of the file is ignored. """
+
+    check_header(path)
+    num_records = (os.path.getsize(path) - HEADER.size) // RECORD.size
+    if num_records == 0:
+        return
+
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER.size, shape=(num_records,))
+    for start in range(0, num_records, chunk_records):
+        yield records[start:start + chunk_records]
+
+
+def read_episodes(path, chunk_records=1 << 20):
+    """ :param path: episode file written by EpisodeRecorder
+        :param chunk_records: number of records read at a time
+
+        Generator over the episodes of 'path'. Each episode is a structured array of its moves followed by
+        its end record. Moves after the last end record (from a recorder that was not closed after a reset)
+        are not yielded. """
+
+    leftover = None
+    for chunk in read_records(path, chunk_records):
+        if leftover is not None:
+            chunk = np.concatenate([leftover, chunk])
+        ends = np.flatnonzero(chunk['action'] < 0)
+        start = 0
+        for end in ends.tolist():
+            yield chunk[start:end + 1]
+            start = end + 1
+        leftover = chunk[start:] if start < len(chunk) else None
+
+
+def episode_statistics(path):
+    """ :param path: episode file written by EpisodeRecorder
+
+        Returns a dictionary with the number of 'episodes', 'moves', agent 'wins', 'draws', 'losses' and
+        'unfinished' games in 'path', computed a chunk at a time. """
+
+    stats = {'episodes': 0, 'moves': 0, 'wins': 0, 'draws': 0, 'losses': 0, 'unfinished': 0}
+    for chunk in read_records(path):
+        ends = chunk['action'] < 0
+        rewards = chunk['reward'][ends]
+        stats['episodes'] += int(np.count_nonzero(ends))
+        stats['moves'] += int(np.count_nonzero(~ends))
+        stats['wins'] += int(np.count_nonzero(rewards == 1.0))
+        stats['draws'] += int(np.count_nonzero(rewards == 0.5))
+        stats['losses'] += int(np.count_nonzero(rewards == 0.0))
+        stats['unfinished'] += int(np.count_nonzero(np.isnan(rewards)))
+    return stats
+
+
+def agent_transitions(episode):
+    """ :param episode: structured array yielded by read_episodes
+
+        Returns arrays (states, actions, rewards, next_states, dones) of the agent's ('X') moves in the
+        episode, in the format of ReplayBuffer.sample. As in replay.ReplayAgent, each move leads to the
+        state of the agent's next move, and its last move ends the game with the episode's reward. Moves of
+        unfinished episodes are all returned with reward 0.0 and the last one is not used. """
+
+    moves = episode[:-1]
+    agent_moves = moves[moves['player'] == PLAYER_CODES['X']]
+    state = agent_moves['state'].astype(np.int64)
+    action = agent_moves['action'].astype(np.int64)
+    next_state = np.append(state[1:], episode[-1]['state'])
+
+    reward = np.zeros(len(state))
+    done = np.zeros(len(state), dtype=bool)
+    if len(state) > 0:
+        final_reward = float(episode[-1]['reward'])
+        if np.isnan(final_reward):
+            state, action, reward, next_state, done = state[:-1], action[:-1], reward[:-1], next_state[:-1], done[:-1]
+        else:
+            reward[-1] = final_reward
+            done[-1] = True
+
+    return state, action, reward, next_state, done
+
+
+def offline_qlearning(agent, path, batch_size=4096):
+    """ :param agent: Agent object on the board size the episodes were played on
+        :param path: episode file written by EpisodeRecorder
+        :param batch_size: approximate number of moves per update
+
+        Trains 'agent' from the games in 'path' without playing any, streaming the file and applying
+        replay.replay_update to batches of the agent's moves in the order they were played. Returns the
+        number of moves learned from. """
+
+    batches = []
+    num_batched = 0
+    num_moves = 0
+    for episode in read_episodes(path):
+        batches.append(agent_transitions(episode))
+        num_batched += len(batches[-1][0])
+        if num_batched >= batch_size:
+            num_moves += _learn(agent, batches)
+            batches = []
+            num_batched = 0
+    if batches:
+        num_moves += _learn(agent, batches)
+    return num_moves
+
+
+def _learn(agent, batches):
+    """ Applies replay_update to the concatenated transitions in 'batches' and returns how many there were. """
+
+    state, action, reward, next_state, done = (np.concatenate(arrays) for arrays in zip(*batches))
+    if len(state) == 0:
+        return 0
+
+    if agent.symmetric:
+        action = symmetry.TO_CANONICAL[symmetry.TRANSFORM[state], action]
+        state = symmetry.CANONICAL[state].astype(np.int64)
+        next_state = symmetry.CANONICAL[next_state].astype(np.int64)
+    replay_update(agent, (state, action, reward, next_state, done))
+    return len(state)
@@ -1,5 +1,7 @@
 import numpy as np
 
+import states
+
 # Hannah Galbraith
 # CS546
 # 3/10/19
@@ -11,10 +13,35 @@ import numpy as np
 ######################
 
 
+# 3^cell for each of the nine cells, used to keep the QMatrix row index up to date
+POWERS_OF_THREE = tuple(3**cell for cell in range(9))
+
+
 class Game(object):
     
-    def __init__(self):
-        self.board = np.zeros((3,3))
+    def __init__(self, size=3, win_length=None):
+        """ :param size: number of rows and columns of the board
+            :param win_length: number of pieces in a row needed to win, or None for 'size'
+
+            Sets up an empty (size x size) board. The winning lines are generated by states.generate_lines,
+            so the same class plays tic-tac-toe, 4x4 boards or gomoku-style games (e.g. size=15, win_length=5). """
+
+        if win_length is None:
+            win_length = size
+        if size < 1 or not 1 <= win_length <= size:
+            raise ValueError("Invalid board: size {} with win length {}.".format(size, win_length))
+
+        self.size = size
+        self.win_length = win_length
+        self.num_cells = size * size
+        self.lines = np.array(states.generate_lines(size, win_length))
+        self.powers = POWERS_OF_THREE if size == 3 else tuple(3**cell for cell in range(self.num_cells))
+        # Tic-tac-toe looks its wins up by state index in the precomputed tables instead of checking lines
+        self.tic_tac_toe = size == 3 and win_length == 3
+
+        self.board = np.zeros((size,size))
+        self.state_index = 0                # Row index into the Agent's QMatrix for the current board
+        self.num_empty = self.num_cells     # Number of empty positions left on the board
 
 
     def make_move(self, position, player):
@@ -24,15 +51,20 @@ class Game(object):
             Method takes a position and player as arguments. If the board is 
             empty in the position given (i.e. if there is a '0' in that grid element),
             then method puts a '1' in that position if the player is 'X' and '2' if 
-            player is '0' and returns True. Otherwise, if the spot is occupied, it returns False. """
+            player is '0' and returns True. Otherwise, if the spot is occupied, it returns False. 
+            The state index and the count of empty positions are updated along with the board. """
 
         move_made = False
 
         if self.board[position[0]][position[1]] == 0:
             if player == 'X':
                 self.board[position[0]][position[1]] = 1
+                code = 1
             else:
                 self.board[position[0]][position[1]] = 2
+                code = 2
+            self.state_index += code * self.powers[position[0] * self.size + position[1]]
+            self.num_empty -= 1
             move_made = True
 
         return move_made
@@ -51,91 +83,68 @@ class Game(object):
         
         return actions
 
+
+    def get_legal_move_mask(self):
+        """ Returns a boolean array with one entry per cell (cell (i, j) is size*i + j) that is True where
+            the board is empty. """
+
+        return self.board.ravel() == 0
+
     
     def translate_board_state_to_index(self):
         """ Method translates the current board state into an integer that can be used to index into the Agent's QMatrix.
-            Returns a sum of (c0 * 3^0 + c1 * 3^1 + ... + c8 * 3^8), where each 'c' is determined by the value currently 
-            in the corresponding position on the board. Returns the final sum. """
+            The index is the sum (c0 * 3^0 + c1 * 3^1 + ... + c8 * 3^8) over the cells, where each 'c' is determined by 
+            the value currently in the corresponding position on the board. make_move() and reset_board() keep the sum up to date, so this 
+            just returns it. """
 
-        index = (self.board[0][0] * 3**0) + (self.board[0][1] * 3**1) + (self.board[0][2] * 3**2) + (self.board[1][0] * 3**3) + (self.board[1][1] * 3**4) + (self.board[1][2] * 3**5) + (self.board[2][0] * 3**6) + (self.board[2][1] * 3**7) + (self.board[2][2] * 3**8)
-        return int(index)
+        return self.state_index
 
 
     def has_agent_won(self):
-        """ Evaluates whether the agent has won by checking if there are three adjacent '1's in the matrix either
-            diagonally, horizontally, or vertically. If so, it returns True. Otherwise, it returns False. """
+        """ Evaluates whether the agent has won by checking if there are 'win_length' adjacent '1's in the matrix 
+            either diagonally, horizontally, or vertically. If so, it returns True. Otherwise, it returns False. 
+            On 3x3 tic-tac-toe this is looked up in states.X_WINS. """
 
-        # Evaluate diagonals
-        if self.board[0][0] == 1 and self.board[1][1] == 1 and self.board[2][2] == 1:
-            return True
-        
-        if self.board[2][0] == 1 and self.board[1][1] == 1 and self.board[0][2] == 1:
-            return True
-
-        # Evaluate horizontally
-        for i in range(self.board.shape[0]):
-            if self.board[i][0] == 1 and self.board[i][1] == 1 and self.board[i][2] == 1:
-                return True
-        
-        # Evaluate vertically
-        for i in range(self.board.shape[1]):
-            if self.board[0][i] == 1 and self.board[1][i] == 1 and self.board[2][i] == 1:
-                return True
-
-        return False
+        if self.tic_tac_toe:
+            return states.X_WINS_LIST[self.state_index]
+        return bool(np.any(np.all(self.board.ravel()[self.lines] == 1, axis=1)))
 
 
     def has_opponent_won(self):
-        """ Evaluates whether the opponent has won by checking if there are three adjacent '2's in the matrix either
-            diagonally, horizontally, or vertically. If so, it returns True. Otherwise, it returns False. """
-
-        # Evaluate diagonals
-        if self.board[0][0] == 2 and self.board[1][1] == 2 and self.board[2][2] == 2:
-            return True
-        
-        if self.board[2][0] == 2 and self.board[1][1] == 2 and self.board[0][2] == 2:
-            return True
+        """ Evaluates whether the opponent has won by checking if there are 'win_length' adjacent '2's in the matrix 
+            either diagonally, horizontally, or vertically. If so, it returns True. Otherwise, it returns False. 
+            On 3x3 tic-tac-toe this is looked up in states.O_WINS. """
 
-        # Evaluate horizontally
-        for i in range(self.board.shape[0]):
-            if self.board[i][0] == 2 and self.board[i][1] == 2 and self.board[i][2] == 2:
-                return True
-        
-        # Evaluate vertically
-        for i in range(self.board.shape[1]):
-            if self.board[0][i] == 2 and self.board[1][i] == 2 and self.board[2][i] == 2:
-                return True
-
-        return False
+        if self.tic_tac_toe:
+            return states.O_WINS_LIST[self.state_index]
+        return bool(np.any(np.all(self.board.ravel()[self.lines] == 2, axis=1)))
 
 
     def is_it_a_draw(self):
-        """ Evaluates whether the game is a draw by iterating through the board to see if there are any '0's
-            left. If so, it returns False. Otherwise, if no '0's are found, it returns True.
+        """ Evaluates whether the game is a draw by checking whether there are any '0's left on the board,
+            using the count of empty positions kept by make_move(). If so, it returns False. Otherwise, it returns True.
             NOTE: This method will only work as intended if has_agent_won() and has_opponent_won() have been
             executed first and both returned False. This method does not check whether either player has won.
             Therefore, it is possible that the method would return True despite there being a winning game. """
 
-        for i in range(self.board.shape[0]):
-            for j in range(self.board.shape[1]):
-                if self.board[i][j] == 0:
-                    return False
-        
-        return True
+        return self.num_empty == 0
 
     
     def reset_board(self):
         """ This method should be invoked after a game has been played. It resets the board by creating a new
-            3x3 matrix of zeros. """
+            matrix of zeros, and zeroes the state index. """
 
-        self.board = np.zeros((3,3))
+        self.board = np.zeros((self.size,self.size))
+        self.state_index = 0
+        self.num_empty = self.num_cells
 
 
     def print_board(self):
         """ Method prints the current board state by translating zeros into ' ', ones into 'X', and twos into 'O'. """
 
-        state = []
+        rows = []
         for i in range(self.board.shape[0]):
+            state = []
             for j in range(self.board.shape[1]):
                 if self.board[i][j] == 0:
                     state.append(' ')
@@ -143,10 +152,248 @@ class Game(object):
                     state.append('X')
                 else:
                     state.append('O')
+            rows.append("|".join(state))
+
+        print(("\n" + "-" * (2 * self.size) + "\n").join(rows))
+        print("\n")
+
+
+# Bit masks for the eight winning lines. Cell (i, j) is stored at bit 3*i + j.
+WIN_MASKS = tuple(sum(1 << cell for cell in line) for line in states.LINES)
+
+FULL_BOARD = 0b111111111
+
+# Lookup tables indexed by a 9-bit mask. IS_WINNING[bits] is True if 'bits' covers
+# one of the masks in WIN_MASKS; EMPTY_POSITIONS[bits] holds the positions of the
+# set bits as (row, col) tuples in row-major order.
+IS_WINNING = tuple(any(bits & mask == mask for mask in WIN_MASKS) for bits in range(FULL_BOARD + 1))
+EMPTY_POSITIONS = tuple(tuple((cell // 3, cell % 3) for cell in range(9) if bits & (1 << cell)) 
+                        for bits in range(FULL_BOARD + 1))
+
+
+class BitboardGame(object):
+
+    size = 3    # Rows and columns of the board, as in Game
+    win_length = 3    # Pieces in a row needed to win, as in Game
+
+    def __init__(self):
+        self.x_bits = 0
+        self.o_bits = 0
+        self.state_index = 0
+        self.num_empty = 9
+
+
+    @property
+    def board(self):
+        """ Returns the current board state as a 3x3 matrix of 0s, 1s and 2s, the same as Game.board. """
+
+        board = np.zeros((3,3))
+        for cell in range(9):
+            if self.x_bits & (1 << cell):
+                board[cell // 3][cell % 3] = 1
+            elif self.o_bits & (1 << cell):
+                board[cell // 3][cell % 3] = 2
+        return board
+
+
+    def make_move(self, position, player):
+        """ :param position: tuple of integers
+            :param player: 'X' or 'O'
+
+            Same as Game.make_move. Sets the position's bit in the player's mask if the position
+            is empty and returns True. Otherwise, it returns False. """
+
+        cell = position[0] * 3 + position[1]
+        bit = 1 << cell
+        if (self.x_bits | self.o_bits) & bit:
+            return False
+
+        if player == 'X':
+            self.x_bits |= bit
+            self.state_index += POWERS_OF_THREE[cell]
+        else:
+            self.o_bits |= bit
+            self.state_index += 2 * POWERS_OF_THREE[cell]
+        self.num_empty -= 1
+        return True
+
+
+    def get_possible_next_moves(self):
+        """ Returns a list of tuples of all empty positions on the board, read from the mask of empty squares. """
+
+        return list(EMPTY_POSITIONS[FULL_BOARD & ~(self.x_bits | self.o_bits)])
+
+
+    def get_legal_move_mask(self):
+        """ Same as Game.get_legal_move_mask, looked up in states.LEGAL. """
+
+        return states.LEGAL[self.state_index]
+
+
+    def translate_board_state_to_index(self):
+        """ Same as Game.translate_board_state_to_index. Returns the sum of (c0 * 3^0 + c1 * 3^1 + ... + c8 * 3^8),
+            which make_move() keeps up to date. """
+
+        return self.state_index
+
+
+    def has_agent_won(self):
+        """ Returns True if the agent's ('X') mask covers one of the winning lines. """
+
+        return IS_WINNING[self.x_bits]
+
+
+    def has_opponent_won(self):
+        """ Returns True if the opponent's ('O') mask covers one of the winning lines. """
+
+        return IS_WINNING[self.o_bits]
+
+
+    def is_it_a_draw(self):
+        """ Returns True if there are no empty squares left. Like Game.is_it_a_draw, it does not check
+            whether either player has won. """
+
+        return self.num_empty == 0
+
+
+    def reset_board(self):
+        """ Clears both players' masks and zeroes the state index. """
+
+        self.x_bits = 0
+        self.o_bits = 0
+        self.state_index = 0
+        self.num_empty = 9
+
+
+    def print_board(self):
+        """ Method prints the current board state the same way as Game.print_board. """
+
+        state = []
+        for cell in range(9):
+            if self.x_bits & (1 << cell):
+                state.append('X')
+            elif self.o_bits & (1 << cell):
+                state.append('O')
+            else:
+                state.append(' ')
 
         print("{}|{}|{}".format(state[0], state[1], state[2]))
         print("------")
         print("{}|{}|{}".format(state[3], state[4], state[5]))
         print("------")
         print("{}|{}|{}".format(state[6], state[7], state[8]))
-        print("\n")
\ No newline at end of file
+        print("\n")
+
+
+class TableGame(object):
+
+    size = 3    # Rows and columns of the board, as in Game
+    win_length = 3    # Pieces in a row needed to win, as in Game
+
+    def __init__(self):
+        self.state_index = 0
+
+
+    @property
+    def board(self):
+        """ Returns the current board state as a 3x3 matrix of 0s, 1s and 2s, the same as Game.board. """
+
+        return states.CELLS[self.state_index].reshape((3,3)).astype(float)
+
+
+    def make_move(self, position, player):
+        """ :param position: tuple of integers
+            :param player: 'X' or 'O'
+
+            Same as Game.make_move. Looks up the index that follows the move in states.SUCCESSOR. If the
+            position is occupied the table holds -1 and the method returns False. """
+
+        if player == 'X':
+            next_index = states.SUCCESSOR_LIST[self.state_index][0][position[0] * 3 + position[1]]
+        else:
+            next_index = states.SUCCESSOR_LIST[self.state_index][1][position[0] * 3 + position[1]]
+
+        if next_index < 0:
+            return False
+
+        self.state_index = next_index
+        return True
+
+
+    def get_possible_next_moves(self):
+        """ Returns a list of tuples of all empty positions on the board, looked up from the state's legal-move mask. """
+
+        return list(EMPTY_POSITIONS[states.LEGAL_MASK_LIST[self.state_index]])
+
+
+    def get_legal_move_mask(self):
+        """ Same as Game.get_legal_move_mask, looked up in states.LEGAL. """
+
+        return states.LEGAL[self.state_index]
+
+
+    def translate_board_state_to_index(self):
+        """ Same as Game.translate_board_state_to_index. The index is the whole state of this backend. """
+
+        return self.state_index
+
+
+    def has_agent_won(self):
+        """ Returns True if 'X' has three in a row, looked up in states.X_WINS. """
+
+        return states.X_WINS_LIST[self.state_index]
+
+
+    def has_opponent_won(self):
+        """ Returns True if 'O' has three in a row, looked up in states.O_WINS. """
+
+        return states.O_WINS_LIST[self.state_index]
+
+
+    def is_it_a_draw(self):
+        """ Returns True if there are no empty squares left. Like Game.is_it_a_draw, it does not check
+            whether either player has won. """
+
+        return states.FULL_LIST[self.state_index]
+
+
+    def reset_board(self):
+        """ Sets the state back to the empty board. """
+
+        self.state_index = 0
+
+
+    def print_board(self):
+        """ Method prints the current board state the same way as Game.print_board. """
+
+        symbols = (' ', 'X', 'O')
+        state = [symbols[value] for value in states.CELLS[self.state_index]]
+
+        print("{}|{}|{}".format(state[0], state[1], state[2]))
+        print("------")
+        print("{}|{}|{}".format(state[3], state[4], state[5]))
+        print("------")
+        print("{}|{}|{}".format(state[6], state[7], state[8]))
+        print("\n")
+
+
+# Game backends that can be switched between. They all have the same public methods.
+GAME_BACKENDS = {'numpy': Game, 'bitboard': BitboardGame, 'table': TableGame}
+
+
+def make_game(backend='numpy', size=3, win_length=None):
+    """ :param backend: name of one of the classes in GAME_BACKENDS
+        :param size: number of rows and columns of the board
+        :param win_length: number of pieces in a row needed to win, or None for 'size'
+
+        Returns a new game that uses the given backend. Only the 'numpy' backend (Game) supports
+        boards other than 3x3 tic-tac-toe. """
+
+    if backend not in GAME_BACKENDS:
+        raise ValueError("Unknown game backend '{}'. Choose one of: {}".format(backend, ", ".join(sorted(GAME_BACKENDS))))
+
+    if backend == 'numpy':
+        return Game(size, win_length)
+    if size != 3 or win_length not in (None, 3):
+        raise ValueError("The '{}' backend only supports 3x3 boards; use the 'numpy' backend.".format(backend))
+    return GAME_BACKENDS[backend]()
\ No newline at end of file
@@ -0,0 +1,182 @@
+import numpy as np
+
+import cProfile
+import json
+import pstats
+import time
+
+from agent import Agent
+from game import GAME_BACKENDS
+from vecgame import VecGame
+
+############################
+# Timers and counters for  #
+# the training loop        #
+############################
+
+# Each phase is timed by wrapping these functions. The wrappers are only installed while
+# instrumentation is enabled, so there is no cost at all when it is off. Phases can nest, e.g.
+# the time spent in terminal checks during assessment counts toward both phases.
+PHASES = [('action_selection', Agent, 'choose_action'),
+          ('q_updates', Agent, 'update_qmatrix'),
+          ('batch_training', Agent, 'qlearning_batch'),
+          ('opponent_moves', VecGame, 'respond')]
+for _backend in GAME_BACKENDS.values():
+    for _method in ('has_agent_won', 'has_opponent_won', 'is_it_a_draw'):
+        PHASES.append(('terminal_checks', _backend, _method))
+
+# Phases for the functions of tictactoe.py. They are wrapped in whichever modules are passed to
+# enable(), since tictactoe.py can be running as '__main__' rather than as 'tictactoe'.
+MODULE_PHASES = [('opponent_moves', 'opponent_moves'),
+                 ('assessment', 'assess_agent'),
+                 ('assessment', 'assess_agent_batch')]
+
+
+class Instrumentation(object):
+
+    def __init__(self):
+        """ Collects the time spent in each phase of training, the number of moves made and the QMatrix
+            rows updated. Use enable() and disable() to switch it on and off at runtime, and summary()
+            or emit() to report on the period since the last reset(). """
+
+        self.enabled = False
+        self._originals = []
+        self.reset()
+
+
+    def reset(self):
+        """ Clears all timers and counters and restarts the clock. """
+
+        self.seconds = {}
+        self.calls = {}
+        self.moves = 0
+        self.rows_touched = set()
+        self.start_time = time.perf_counter()
+
+
+    def enable(self, *modules):
+        """ :param modules: modules with the functions in MODULE_PHASES, e.g. tictactoe
+
+            Installs the timing wrappers around every function in PHASES and the functions of MODULE_PHASES 
+            in 'modules', and the counters around the move and update methods. Does nothing if already enabled. """
+
+        if self.enabled:
+            return
+
+        for phase, owner, name in PHASES:
+            self._wrap(owner, name, self._timed(phase, getattr(owner, name)))
+        for module in modules:
+            for phase, name in MODULE_PHASES:
+                if hasattr(module, name):
+                    self._wrap(module, name, self._timed(phase, getattr(module, name)))
+
+        for backend in GAME_BACKENDS.values():
+            self._wrap(backend, 'make_move', self._counted_move(backend.make_move))
+        self._wrap(VecGame, 'move', self._counted_batch_move(VecGame.move))
+        self._wrap(Agent, 'update_qmatrix', self._counted_update(Agent.update_qmatrix))
+
+        self.enabled = True
+
+
+    def disable(self):
+        """ Removes every wrapper installed by enable(), restoring the original functions. """
+
+        for owner, name, original in reversed(self._originals):
+            setattr(owner, name, original)
+        self._originals = []
+        self.enabled = False
+
+
+    def summary(self, **extra):
+        """ :param extra: values added to the summary, e.g. epoch=3. If it includes 'games', the
+                          summary also has 'games_per_sec'.
+
+            Returns a dictionary with the time elapsed since the last reset(), the moves made, the
+            number of distinct QMatrix rows updated, throughput, and the seconds and calls of each phase. """
+
+        elapsed = time.perf_counter() - self.start_time
+        summary = dict(extra)
+        summary['elapsed'] = elapsed
+        summary['moves'] = self.moves
+        summary['moves_per_sec'] = self.moves / elapsed if elapsed > 0 else 0.0
+        if 'games' in extra:
+            summary['games_per_sec'] = extra['games'] / elapsed if elapsed > 0 else 0.0
+        summary['q_rows_touched'] = len(self.rows_touched)
+        summary['phases'] = {phase: {'seconds': self.seconds[phase], 'calls': self.calls[phase]}
+                             for phase in sorted(self.seconds)}
+        return summary
+
+
+    def emit(self, stream, **extra):
+        """ :param stream: file object opened for writing text
+            :param extra: passed on to summary()
+
+            Writes summary() to 'stream' as one line of JSON. """
+
+        stream.write(json.dumps(self.summary(**extra)) + "\n")
+        stream.flush()
+
+
+    def _wrap(self, owner, name, wrapper):
+        self._originals.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, wrapper)
+
+
+    def _timed(self, phase, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds[phase] = self.seconds.get(phase, 0.0) + time.perf_counter() - start
+                self.calls[phase] = self.calls.get(phase, 0) + 1
+        return wrapper
+
+
+    def _counted_move(self, func):
+        def wrapper(game, position, player):
+            self.moves += 1
+            return func(game, position, player)
+        return wrapper
+
+
+    def _counted_batch_move(self, func):
+        def wrapper(vecgame, actions):
+            self.moves += int(np.count_nonzero(~vecgame.done))
+            return func(vecgame, actions)
+        return wrapper
+
+
+    def _counted_update(self, func):
+        def wrapper(agent, state, action, reward, new_state):
+            if np.ndim(state) == 0:
+                self.rows_touched.add(int(state))
+            else:
+                self.rows_touched.update(np.asarray(state).tolist())
+            return func(agent, state, action, reward, new_state)
+        return wrapper
+
+
+# Instrumentation shared by the whole program
+STATS = Instrumentation()
+
+
+def start_profile():
+    """ Starts cProfile and returns the profiler to pass to stop_profile(). """
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profile(profiler, path, top=20):
+    """ :param profiler: profiler returned by start_profile()
+        :param path: file to save the pstats data to
+        :param top: number of functions to print, sorted by cumulative time. 0 prints nothing.
+
+        Stops the profiler and dumps its statistics to 'path' (readable with pstats). """
+
+    profiler.disable()
+    profiler.dump_stats(path)
+    if top > 0:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
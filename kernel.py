@@ -0,0 +1,180 @@
+import numpy as np
+
+import random
+
+import states
+from agent import Agent
+from game import GAME_BACKENDS
+from policies import EpsilonGreedy
+
+##########################
+# Allocation-free kernel #
+# for single-game        #
+# training               #
+##########################
+
+# LEGAL_CELLS[state] is a tuple of the empty cells of the board, in ascending order. That is the order of
+# Game.get_possible_next_moves and of the masks used by policies.masked_argmax and random_legal, and
+# CHOICES[k] is range(k). random.choice only uses the length of what it is given, so choosing from these
+# makes the same draws as choosing from the lists and arrays that opponent_moves and the policies build,
+# without building them.
+_CELLS_OF_MASK = tuple(tuple(cell for cell in range(9) if bits & (1 << cell)) for bits in range(1 << 9))
+LEGAL_CELLS = [_CELLS_OF_MASK[bits] for bits in states.LEGAL_MASK_LIST]
+CHOICES = tuple(range(k) for k in range(10))
+
+
+def supports(agent, game):
+    """ :param agent: Agent object
+        :param game: Game object the training loop would play on
+
+        Returns True if train_games can stand in for the training loop: 'agent' is a plain Agent with a
+        dense, writable float64 QMatrix for 3x3 boards, that is not symmetric and chooses its moves with
+        policies.EpsilonGreedy, and 'game' is an instance of one of the classes in game.GAME_BACKENDS that
+        plays 3x3 boards with three in a row to win, the only game whose tables train_games uses.
+        Subclasses such as ReplayAgent or RowLockingAgent change what an update does, and wrappers such as
+        episodes.RecordingGame need to see every move, since train_games never touches the game, so those
+        use the generic loop. """
+
+    return (type(game) in GAME_BACKENDS.values() and game.size == 3 and game.win_length == 3
+            and type(agent) is Agent and type(agent.policy) is EpsilonGreedy and agent.player == 'X'
+            and agent.size == 3 and not agent.symmetric and isinstance(agent.qmatrix, np.ndarray)
+            and agent.qmatrix.dtype == np.float64 and agent.qmatrix.flags.c_contiguous
+            and agent.qmatrix.flags.writeable)
+
+
+def train_games(agent, player, num_training_games, stop, m, epsilon_increase):
+    """ :param agent: Agent object for which supports(agent) is True
+        :param player: 'X' or 'O', who moves first in the next call of train_agent
+        :param num_training_games: number of games already played this epoch
+        :param stop: number of training games per epoch
+        :param m: number of games before epsilon is increased
+        :param epsilon_increase: float
+
+        Runs the single-game training loop of tictactoe.train, i.e. repeated calls of train_agent against
+        opponent_moves with 'player' switching after each call, until 'stop' games have been played.
+        The results are identical to that loop under the same seeds: the same QMatrix, epsilon,
+        training_games, prev_state and prev_action, and the same ConvergenceTracker summary and dirty rows.
+
+        The board is a state index that moves through states.SUCCESSOR, the QMatrix is read and written
+        through a memoryview, and ties are collected in a preallocated buffer. No lists, arrays or numpy
+        scalars are created per move. The game starts from the empty board and ends when a game finishes,
+        which is where the loop in tictactoe.train starts and ends too. Returns the number of games played
+        and the player who moves first in the next call. """
+
+    q = memoryview(agent.qmatrix.reshape(-1))   # q[9*state + action] is QMatrix[state][action]
+    ties = [0] * 9      # Cells with the highest Q-value, for breaking ties
+
+    successor = states.SUCCESSOR_LIST
+    x_wins = states.X_WINS_LIST
+    o_wins = states.O_WINS_LIST
+    full = states.FULL_LIST
+    legal_cells = LEGAL_CELLS
+    choices = CHOICES
+
+    # The policy and opponent_moves can draw from different generators if the policy was seeded
+    policy_random = agent.policy.rng.random
+    policy_choice = agent.policy.rng.choice
+    opponent_choice = random.choice
+
+    eta = agent.eta
+    gamma = agent.gamma
+    explore = 1 - agent.epsilon
+    prev_state = agent.prev_state
+    prev_action = agent.prev_action
+    tracker = agent.convergence
+    updates = tracker.updates
+    abs_sum = tracker.abs_sum
+    max_abs = tracker.max_abs
+    rows = tracker.rows
+    dirty = tracker.dirty if tracker.track_dirty else set()     # Thrown away when dirty rows are not tracked
+
+    opponent_first = player == 'O'
+    state = 0
+    finished = 0
+
+    while num_training_games < stop:
+        if num_training_games == m or num_training_games == (stop - 1):
+            agent.update_epsilon(epsilon_increase)
+            explore = 1 - agent.epsilon
+
+        # opponent_moves, when the opponent moves first in this call
+        if opponent_first:
+            cells = legal_cells[state]
+            if cells:
+                state = successor[state][1][opponent_choice(cells)]
+
+        # Agent.qlearning: pick the update it makes, then apply it as Agent.update_qmatrix does
+        done = True
+        if o_wins[state]:
+            update_state, action, reward, new_state = prev_state, prev_action, 0, state
+        elif full[state]:
+            update_state, action, reward, new_state = prev_state, prev_action, 0.5, state
+        else:
+            cells = legal_cells[state]
+            if policy_random() < explore:
+                action = policy_choice(cells)
+            else:
+                base = 9 * state
+                best = q[base + cells[0]]
+                num_ties = 0
+                for cell in cells:
+                    value = q[base + cell]
+                    if value > best:
+                        best = value
+                        ties[0] = cell
+                        num_ties = 1
+                    elif value == best:
+                        ties[num_ties] = cell
+                        num_ties += 1
+                action = ties[policy_choice(choices[num_ties])]
+
+            update_state = state
+            new_state = successor[state][0][action]
+            if x_wins[new_state]:
+                reward = 1
+            elif full[new_state]:
+                reward = 0.5
+            else:
+                reward = 0
+                done = False
+            state = new_state
+
+        base = 9 * new_state
+        old_value = q[9 * update_state + action]
+        delta = eta * (reward + gamma * max(q[base:base + 9]) - old_value)
+        q[9 * update_state + action] = old_value + delta
+
+        # ConvergenceTracker.observe
+        updates += 1
+        abs_delta = abs(delta)
+        abs_sum += abs_delta
+        if abs_delta > max_abs:
+            max_abs = abs_delta
+        rows.add(update_state)
+        dirty.add(update_state)
+
+        if done:
+            prev_state = None
+            prev_action = None
+            state = 0
+            finished += 1
+            num_training_games += 1
+        else:
+            prev_state = update_state
+            prev_action = action
+            # opponent_moves, when the agent moved first in this call
+            if not opponent_first:
+                cells = legal_cells[state]
+                if cells:
+                    state = successor[state][1][opponent_choice(cells)]
+
+        opponent_first = not opponent_first
+
+    agent.prev_state = prev_state
+    agent.prev_action = prev_action
+    agent.training_games += finished
+    tracker.updates = updates
+    tracker.abs_sum = abs_sum
+    tracker.max_abs = max_abs
+
+    return num_training_games, 'O' if opponent_first else 'X'
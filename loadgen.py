@@ -0,0 +1,128 @@
+import numpy as np
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from server import GREETING
+
+##########################
+# Load generator for the #
+# game server            #
+##########################
+
+
+async def play_session(host, port, unix_path, num_games, rng, latencies):
+    """ :param host: server address
+        :param port: server TCP port
+        :param unix_path: path of the server's UNIX socket, or None to use TCP
+        :param num_games: games to play on this connection
+        :param rng: random.Random used to choose the user's moves
+        :param latencies: list that the round-trip time of every request is appended to, in seconds
+
+        Opens one connection and plays 'num_games' games against the server with random moves, taking
+        turns at moving first. Returns the number of games finished. """
+
+    if unix_path is not None:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    greeting = (await reader.readline()).decode().strip()
+    if greeting != GREETING:
+        raise ValueError("Unexpected greeting from the server: '{}'".format(greeting))
+
+    async def request(line):
+        start = time.perf_counter()
+        writer.write((line + "\n").encode())
+        await writer.drain()
+        response = (await reader.readline()).decode().split()
+        latencies.append(time.perf_counter() - start)
+        if response[0] != "OK":
+            raise ValueError("Server answered '{}' to '{}'".format(" ".join(response), line))
+        return response[1], response[2]
+
+    finished = 0
+    for i in range(num_games):
+        board, status = await request("NEW agent" if i % 2 == 0 else "NEW user")
+        while status == "playing":
+            cell = rng.choice([cell for cell, symbol in enumerate(board) if symbol == '.'])
+            board, status = await request("MOVE {},{}".format(cell // 3, cell % 3))
+        finished += 1
+
+    writer.write(b"QUIT\n")
+    await writer.drain()
+    writer.close()
+    return finished
+
+
+async def run_load(host, port, unix_path, num_sessions, games_per_session, concurrency, seed):
+    """ Plays 'num_sessions' sessions of 'games_per_session' games, at most 'concurrency' at a time, and
+        returns a dictionary of throughput and round-trip latency statistics. """
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(index):
+        async with semaphore:
+            return await play_session(host, port, unix_path, games_per_session, random.Random(seed + index), latencies)
+
+    start = time.perf_counter()
+    games = await asyncio.gather(*(limited(index) for index in range(num_sessions)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1e6
+    return {'sessions': num_sessions,
+            'concurrency': concurrency,
+            'games': int(sum(games)),
+            'requests': len(latencies),
+            'elapsed': elapsed,
+            'sessions_per_sec': num_sessions / elapsed,
+            'games_per_sec': sum(games) / elapsed,
+            'requests_per_sec': len(latencies) / elapsed,
+            'latency_p50_us': float(np.percentile(latencies, 50)),
+            'latency_p90_us': float(np.percentile(latencies, 90)),
+            'latency_p99_us': float(np.percentile(latencies, 99)),
+            'latency_p999_us': float(np.percentile(latencies, 99.9)),
+            'latency_max_us': float(latencies.max())}
+
+
+async def server_stats(host, port, unix_path):
+    """ Returns the server's STATS response as a dictionary. """
+
+    if unix_path is not None:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    await reader.readline()
+    writer.write(b"STATS\nQUIT\n")
+    await writer.drain()
+    stats = json.loads((await reader.readline()).decode())
+    writer.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the throughput and latency of the game server.")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="connect to this UNIX socket instead of TCP")
+    parser.add_argument('--sessions', type=int, default=1000, help="number of sessions (connections) to run")
+    parser.add_argument('--games', type=int, default=10, help="games per session")
+    parser.add_argument('--concurrency', type=int, default=100, help="sessions open at the same time")
+    parser.add_argument('--seed', type=int, default=546)
+    args = parser.parse_args()
+
+    results = asyncio.run(run_load(args.host, args.port, args.unix, args.sessions, args.games, args.concurrency, args.seed))
+    for name, value in results.items():
+        print("{:<20} {:>14.1f}".format(name, value) if isinstance(value, float) else "{:<20} {:>14}".format(name, value))
+
+    stats = asyncio.run(server_stats(args.host, args.port, args.unix))
+    print("Server-side agent move latency: p50 {:.1f} us, p99 {:.1f} us, max {:.1f} us".format(
+          stats['latency_p50_us'], stats['latency_p99_us'], stats['latency_max_us']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import csv
+import json
+import os
+
+##########################
+# Streaming per-epoch    #
+# metrics to disk        #
+##########################
+
+
+class MetricsWriter(object):
+
+    def __init__(self, path):
+        """ :param path: file to append to. Files ending in '.csv' are written as CSV, anything else as
+                         JSON lines.
+
+            Writes one row of metrics at a time, flushing after each so the file can be followed while
+            training runs. For CSV, the columns are those of the header of an existing file, or else of
+            the first row written, which is then written as the header. Every row must have exactly those
+            keys, so that appending to a file never puts rows under the wrong header. """
+
+        self.path = path
+        self.csv = path.lower().endswith(".csv")
+        self.fieldnames = None
+        if self.csv and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, newline="") as f:
+                self.fieldnames = next(csv.reader(f))
+        self.file = open(path, "a", newline="" if self.csv else None)
+        self.writer = None
+
+
+    def write(self, row):
+        """ :param row: dictionary of JSON-serializable values
+
+            Raises ValueError if the file is CSV and the keys of 'row' are not its columns. """
+
+        if self.csv:
+            if self.writer is None:
+                new_file = self.fieldnames is None
+                if new_file:
+                    self.fieldnames = list(row)
+                self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames)
+                if new_file:
+                    self.writer.writeheader()
+            if set(row) != set(self.fieldnames):
+                raise ValueError("Metrics row with columns {} does not match the columns of '{}': {}".format(
+                                 sorted(row), self.path, self.fieldnames))
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+
+
+    def close(self):
+        self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,158 @@
+import numpy as np
+
+import random
+
+import solver
+import states
+
+###########################
+# Opponents for training  #
+# and assessing the agent #
+###########################
+
+# SWAPPED[state] is the index of the board with every 'X' and 'O' swapped. It lets a policy learned
+# by the agent as 'X' be played from the 'O' side.
+SWAPPED = ((states.CELLS == 2) * 1 + (states.CELLS == 1) * 2).astype(np.int64).dot(3 ** np.arange(9)).astype(np.int32)
+
+# Preference order for breaking ties between moves: centre, corners, then edges
+MOVE_ORDER = solver.MOVE_ORDER
+
+
+class Opponent(object):
+
+    def __init__(self, epsilon=0.0, seed=None):
+        """ :param epsilon: float between [0.0, 1.0], the probability of a uniformly random move
+            :param seed: seed for the opponent's own random generator, or None to use the random module
+
+            Base class for the opponent, which plays 'O'. An opponent is called with a Game object, like
+            tictactoe.opponent_moves, so it can be passed as the 'opponent' of train_agent, play_game and
+            assess_agent. Deterministic opponents compile their policy into 'table', an array with the cell
+            (0-8) to play in every state index (-1 where the board is full); a move is then a single read
+            from the table. With 'epsilon', they play a uniformly random move instead with that probability. """
+
+        self.epsilon = epsilon
+        self.rng = random if seed is None else random.Random(seed)
+        self.table = None
+        self._table_list = None
+
+
+    def __call__(self, game):
+        """ :param game: Game object
+
+            Makes the opponent's move on 'game', unless the board is full. """
+
+        if self._table_list is None or (self.epsilon > 0.0 and self.rng.random() < self.epsilon):
+            actions = game.get_possible_next_moves()
+            if len(actions) > 0:
+                game.make_move(position=self.rng.choice(actions), player='O')
+        else:
+            cell = self._table_list[game.translate_board_state_to_index()]
+            if cell >= 0:
+                game.make_move(position=(cell // 3, cell % 3), player='O')
+
+
+    def compile(self):
+        """ Builds 'table' from the opponent's policy. Subclasses with a deterministic policy override
+            policy() and call this from their constructor. """
+
+        table = np.array([self.policy(state) for state in range(states.NUM_STATES)], dtype=np.int8)
+        self.set_table(table)
+
+
+    def set_table(self, table):
+        """ :param table: integer array with a cell (0-8, or -1) for every state index
+
+            Makes the opponent play from 'table'. """
+
+        self.table = table
+        self._table_list = table.tolist()
+
+
+    def policy(self, state):
+        """ :param state: base-3 state index
+
+            Returns the cell the opponent plays in 'state', or -1 if the board is full. """
+
+        raise NotImplementedError
+
+
+def first_empty(state, cells=MOVE_ORDER):
+    """ Returns the first empty cell of the board 'state' in the order given by 'cells', or -1 if none is. """
+
+    legal_mask = states.LEGAL_MASK_LIST[state]
+    for cell in cells:
+        if legal_mask & (1 << cell):
+            return cell
+    return -1
+
+
+class RandomOpponent(Opponent):
+
+    def __init__(self, seed=None):
+        """ :param seed: seed for the opponent's own random generator, or None to use the random module
+
+            Plays a uniformly random move, the same as tictactoe.opponent_moves. It has no table. """
+
+        Opponent.__init__(self, epsilon=1.0, seed=seed)
+
+
+class GreedyOpponent(Opponent):
+
+    def __init__(self, epsilon=0.0, seed=None):
+        """ One-ply greedy opponent: it completes a line of its own if it can, otherwise it blocks a line the
+            agent could complete, otherwise it plays the first empty cell of MOVE_ORDER. """
+
+        Opponent.__init__(self, epsilon=epsilon, seed=seed)
+        self.compile()
+
+
+    def policy(self, state):
+        successors = states.SUCCESSOR_LIST[state]
+        for cell in MOVE_ORDER:
+            if successors[1][cell] >= 0 and states.O_WINS_LIST[successors[1][cell]]:
+                return cell
+        for cell in MOVE_ORDER:
+            if successors[0][cell] >= 0 and states.X_WINS_LIST[successors[0][cell]]:
+                return cell
+        return first_empty(state)
+
+
+class MinimaxOpponent(Opponent):
+
+    def __init__(self, epsilon=0.0, seed=None):
+        """ Plays an optimal move found by the solver, taking the first one in MOVE_ORDER. In positions that
+            no game with 'O' to move can reach, where the solver's answer is meaningless, it plays the first
+            empty cell of MOVE_ORDER. With epsilon=0.0 it never loses a game where the players take turns. """
+
+        Opponent.__init__(self, epsilon=epsilon, seed=seed)
+        self.compile()
+
+
+    def compile(self):
+        table = np.array([first_empty(state) for state in range(states.NUM_STATES)], dtype=np.int8)
+
+        reachable = states.REACHABLE[~states.TERMINAL[states.REACHABLE]]
+        num_x = np.count_nonzero(states.CELLS[reachable] == 1, axis=1)
+        num_o = np.count_nonzero(states.CELLS[reachable] == 2, axis=1)
+        for state in reachable[(num_o == num_x) | (num_o + 1 == num_x)].tolist():
+            optimal = solver.optimal_moves(state, solver.O)
+            table[state] = min(optimal, key=MOVE_ORDER.index)
+
+        self.set_table(table)
+
+
+class SnapshotOpponent(Opponent):
+
+    def __init__(self, agent, epsilon=0.0, seed=None):
+        """ :param agent: Agent object
+
+            Plays the greedy policy of a frozen copy of 'agent'. The agent learned its Q-values as 'X', so the
+            opponent looks them up with the pieces swapped (SWAPPED) and plays the legal move with the highest
+            value, taking the first one in cell order on ties. Later training of 'agent' does not change it. """
+
+        Opponent.__init__(self, epsilon=epsilon, seed=seed)
+        values = agent.action_values(SWAPPED)
+        legal = states.CELLS == 0
+        table = np.where(legal, values, -np.inf).argmax(axis=1).astype(np.int8)
+        table[states.FULL] = -1
+        self.set_table(table)
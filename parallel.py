@@ -0,0 +1,216 @@
+import numpy as np
+
+import multiprocessing
+import random
+import time
+from multiprocessing import shared_memory
+
+from agent import Agent
+from game import make_game
+from tictactoe import assess_agent, train_agent
+
+###########################
+# Multi-core training     #
+# with a shared QMatrix   #
+###########################
+
+# Set in each worker process by _init_worker
+_worker_agent = None
+_worker_game = None
+_worker_shm = None
+
+
+class RowLockingAgent(Agent):
+
+    def __init__(self, eta, gamma, epsilon, locks, compact=False, symmetric=False):
+        """ :param locks: list of multiprocessing.Lock objects
+
+            Agent whose QMatrix updates hold a lock for the row being updated. Rows share the
+            locks in 'locks' round-robin, so row 'state' uses locks[state % len(locks)]. """
+
+        Agent.__init__(self, eta, gamma, epsilon, compact=compact, symmetric=symmetric)
+        self.locks = locks
+
+
+    def update_qmatrix(self, state, action, reward, new_state):
+        """ Same as Agent.update_qmatrix, holding the lock for row 'state' during the update. """
+
+        with self.locks[state % len(self.locks)]:
+            Agent.update_qmatrix(self, state, action, reward, new_state)
+
+
+def qmatrix_values(agent):
+    """ :param agent: Agent object
+
+        Returns the numpy array holding the agent's Q-values: the QMatrix itself, or the 'values'
+        array of a CompactQMatrix. """
+
+    if isinstance(agent.qmatrix, np.ndarray):
+        return agent.qmatrix
+    return agent.qmatrix.values
+
+
+def set_qmatrix_values(agent, values):
+    """ :param agent: Agent object
+        :param values: numpy array with the same shape and dtype as qmatrix_values(agent)
+
+        Makes the agent use 'values' as its Q-values without copying them. """
+
+    if isinstance(agent.qmatrix, np.ndarray):
+        agent.qmatrix = values
+    else:
+        agent.qmatrix.values = values
+
+
+def _init_worker(shm_name, shape, dtype, config, locks, backend):
+    """ Pool initializer. Creates this worker's agent and game and points the agent's QMatrix
+        at the shared memory block. """
+
+    global _worker_agent, _worker_game, _worker_shm
+
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    if locks is None:
+        _worker_agent = Agent(config['eta'], config['gamma'], config['epsilon'],
+                              compact=config['compact'], symmetric=config['symmetric'])
+    else:
+        _worker_agent = RowLockingAgent(config['eta'], config['gamma'], config['epsilon'], locks,
+                                        compact=config['compact'], symmetric=config['symmetric'])
+    set_qmatrix_values(_worker_agent, np.ndarray(shape, dtype=dtype, buffer=_worker_shm.buf))
+    _worker_game = make_game(backend)
+
+
+def _train_games(args):
+    """ :param args: tuple of (number of games, epsilon, seed)
+
+        Pool task. Trains the worker's agent for the given number of games at the given epsilon in
+        the same way as the training loop in tictactoe.main. Returns the number of games played and
+        the time it took in seconds. """
+
+    num_games, epsilon, seed = args
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+
+    agent = _worker_agent
+    game = _worker_game
+    agent.epsilon = epsilon
+    agent.prev_state = None
+    agent.prev_action = None
+    game.reset_board()
+
+    start = time.perf_counter()
+    player = 'X'
+    games_played = 0
+    while games_played < num_games:
+        result = train_agent(player, agent, game)
+        if result == "done":
+            games_played += 1
+
+        if player == 'X':
+            player = 'O'
+        else:
+            player = 'X'
+
+    return games_played, time.perf_counter() - start
+
+
+def _split(num_games, num_workers):
+    """ Splits 'num_games' into 'num_workers' nearly equal parts, dropping empty ones. """
+
+    parts = [num_games // num_workers] * num_workers
+    for i in range(num_games % num_workers):
+        parts[i] += 1
+    return [part for part in parts if part > 0]
+
+
+def train_parallel(agent, num_workers, num_epochs, stop, m, epsilon_increase, lock_rows=False,
+                   num_locks=1024, backend='table', seed=None, verbose=True):
+    """ :param agent: Agent object
+        :param num_workers: number of worker processes
+        :param num_epochs: number of training epochs
+        :param stop: number of training games per epoch
+        :param m: number of games played in an epoch before epsilon is increased
+        :param epsilon_increase: amount epsilon is increased by
+        :param lock_rows: if True, QMatrix updates hold a per-row lock. Otherwise workers update the
+                          shared QMatrix without any locking (Hogwild-style).
+        :param num_locks: number of locks shared round-robin by the rows when 'lock_rows' is True
+        :param backend: name of the game backend the workers use
+        :param seed: integer seed for the workers, or None
+        :param verbose: if True, print throughput after every epoch
+
+        Trains 'agent' on 'num_workers' processes that all update one QMatrix held in shared memory.
+        Each epoch is split at the points where tictactoe.main increases epsilon (after 'm' games
+        and before the last game), and the games of each part are divided between the workers,
+        so all of them train with the same epsilon. The agent is assessed between epochs while the
+        workers are idle, in the same way as in main. When training finishes, the agent's QMatrix
+        is copied back into ordinary memory.
+
+        Returns the list of assessment results (one per epoch plus the one before training) and a
+        list with the average games/sec per worker in every epoch. """
+
+    values = qmatrix_values(agent)
+    shm = shared_memory.SharedMemory(create=True, size=values.nbytes)
+    shared_values = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)
+    shared_values[:] = values
+    set_qmatrix_values(agent, shared_values)
+
+    config = {'eta': agent.eta, 'gamma': agent.gamma, 'epsilon': agent.epsilon,
+              'compact': not isinstance(agent.qmatrix, np.ndarray), 'symmetric': agent.symmetric}
+    locks = [multiprocessing.Lock() for _ in range(num_locks)] if lock_rows else None
+    seeds = random.Random(seed)
+
+    game = make_game(backend)
+    y_axis = []
+    worker_rates = []
+    try:
+        with multiprocessing.Pool(num_workers, initializer=_init_worker,
+                                  initargs=(shm.name, values.shape, values.dtype, config, locks, backend)) as pool:
+            player = 'X'
+            player, y_axis = assess_agent(player, agent, game, y_axis)
+            for epoch in range(num_epochs):
+                segments = [m, stop - 1 - m, 1]
+                games = 0
+                busy_time = 0.0
+                start = time.perf_counter()
+                for i, segment in enumerate(segments):
+                    tasks = [(part, agent.epsilon, seeds.randrange(2**63)) for part in _split(segment, num_workers)]
+                    for games_played, elapsed in pool.map(_train_games, tasks):
+                        games += games_played
+                        busy_time += elapsed
+                    if i < len(segments) - 1:
+                        agent.update_epsilon(epsilon_increase)
+                wall_time = time.perf_counter() - start
+                agent.training_games += games
+
+                rate = games / busy_time if busy_time > 0 else 0.0
+                worker_rates.append(rate)
+                if verbose:
+                    print("Epoch {}: {} games in {:.2f}s, {:.0f} games/sec total, {:.0f} games/sec per worker".format(
+                          epoch + 1, games, wall_time, games / wall_time, rate))
+
+                game.reset_board()
+                player, y_axis = assess_agent(player, agent, game, y_axis)
+    finally:
+        set_qmatrix_values(agent, np.array(shared_values))
+        del shared_values
+        shm.close()
+        shm.unlink()
+
+    return y_axis, worker_rates
+
+
+def main():
+    agent = Agent(eta=0.5, gamma=0.9, epsilon=0.1)
+
+    # Set hyperparameters
+    num_epochs = 10
+    stop = 10000
+    epsilon_increase = 0.05
+    m = 5000  # The amount of games played before it's time to increase epsilon
+    num_workers = multiprocessing.cpu_count()
+
+    y_axis, _ = train_parallel(agent, num_workers, num_epochs, stop, m, epsilon_increase)
+    print("Wins out of 10 after each epoch: {}".format(y_axis))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import numpy as np
+
+import random
+
+import states
+from qtable import SparseQMatrix
+
+##########################
+# Action selection over  #
+# masked QMatrix rows    #
+##########################
+
+# Every policy takes the Q-values of one QMatrix row (shape (9,)) or of a batch of rows (shape (N, 9)),
+# along with a boolean mask of the legal columns in the same shape, and returns the chosen column, or
+# an array of them. Illegal columns are never chosen. Ties between the highest values are broken at
+# random, so a row whose legal values are all equal (e.g. an untrained row of zeros) gives a uniformly
+# random legal move. Single rows draw from the random module, like the rest of the single-game code;
+# batches draw from numpy's generator, like Agent.qlearning_batch and VecGame.
+
+
+def masked_argmax(values, legal, rng=random, np_rng=np.random):
+    """ :param values: Q-values of one row, or of a batch of rows
+        :param legal: boolean mask of the legal columns, the same shape as 'values'
+        :param rng: random module or random.Random, used for a single row
+        :param np_rng: numpy.random module or numpy.random.RandomState, used for a batch
+
+        Returns the legal column with the highest value (or one per row), breaking ties at random. """
+
+    masked = np.where(legal, values, -np.inf)
+    if masked.ndim == 1:
+        return int(rng.choice(np.flatnonzero(masked == masked.max())))
+
+    best = masked == masked.max(axis=1, keepdims=True)
+    return np.where(best, np_rng.random(masked.shape), -1.0).argmax(axis=1)
+
+
+def random_legal(legal, rng=random, np_rng=np.random):
+    """ :param legal: boolean mask of the legal columns of one row, or of a batch of rows
+        :param rng: random module or random.Random, used for a single row
+        :param np_rng: numpy.random module or numpy.random.RandomState, used for a batch
+
+        Returns a uniformly random legal column (or one per row). """
+
+    if np.ndim(legal) == 1:
+        return int(rng.choice(np.flatnonzero(legal)))
+    return np.where(legal, np_rng.random(np.shape(legal)), -1.0).argmax(axis=1)
+
+
+class Policy(object):
+
+    def __init__(self, seed=None):
+        """ :param seed: seed for the policy's own random generators, or None to use the random module
+                         and numpy's global generator
+
+            Base class for the exploration policies used by Agent to choose its moves. """
+
+        self.rng = random if seed is None else random.Random(seed)
+        self.np_rng = np.random if seed is None else np.random.RandomState(seed)
+
+
+    def select(self, values, legal, agent, state, explore=True):
+        """ :param values: Q-values of one QMatrix row, or of a batch of rows
+            :param legal: boolean mask of the legal columns, the same shape as 'values'
+            :param agent: Agent object choosing the move
+            :param state: QMatrix row index of 'values', or array of them
+            :param explore: if False, choose greedily
+
+            Returns the chosen column, or an array with one per row. """
+
+        raise NotImplementedError
+
+
+    def greedy(self, values, legal):
+        """ Returns masked_argmax(values, legal) using the policy's random generators. """
+
+        return masked_argmax(values, legal, self.rng, self.np_rng)
+
+
+class EpsilonGreedy(Policy):
+
+    def __init__(self, seed=None):
+        """ The agent's original policy. As elsewhere in this program, the agent's 'epsilon' is the
+            probability of acting greedily, so a random legal move is chosen with probability
+            (1 - agent.epsilon) and the greedy move otherwise. """
+
+        Policy.__init__(self, seed)
+
+
+    def select(self, values, legal, agent, state, explore=True):
+        if np.ndim(values) == 1:
+            if explore and self.rng.random() < (1 - agent.epsilon):
+                return random_legal(legal, self.rng)
+            return self.greedy(values, legal)
+
+        greedy = self.greedy(values, legal)
+        if not explore:
+            return greedy
+        random_actions = random_legal(legal, np_rng=self.np_rng)
+        return np.where(self.np_rng.random(len(values)) < (1 - agent.epsilon), random_actions, greedy)
+
+
+class Boltzmann(Policy):
+
+    def __init__(self, temperature=0.1, seed=None):
+        """ :param temperature: float > 0.0. Lower temperatures favour the highest values more strongly.
+
+            Softmax exploration: a legal move is chosen with probability proportional to
+            exp(Q(s,a) / temperature). """
+
+        Policy.__init__(self, seed)
+        self.temperature = temperature
+
+
+    def select(self, values, legal, agent, state, explore=True):
+        if not explore:
+            return self.greedy(values, legal)
+
+        masked = np.where(legal, values, -np.inf)
+        weights = np.exp((masked - masked.max(axis=-1, keepdims=True)) / self.temperature)
+        cumulative = np.cumsum(weights, axis=-1)
+        if cumulative.ndim == 1:
+            return int(np.searchsorted(cumulative, self.rng.random() * cumulative[-1], side='right'))
+
+        threshold = self.np_rng.random(len(cumulative)) * cumulative[:, -1]
+        return np.count_nonzero(cumulative <= threshold[:, None], axis=1)
+
+
+class UCB(Policy):
+
+    def __init__(self, c=1.0, seed=None):
+        """ :param c: float >= 0.0, the weight of the exploration bonus
+
+            Upper confidence bound exploration: the policy counts how often it has chosen each move in each
+            QMatrix row and chooses the legal move with the highest Q(s,a) + c * sqrt(ln N(s) / N(s,a)),
+            where N(s) is the number of choices made in row s. Moves never chosen in a row come first. The
+            counts are kept in the same kind of store as a SparseQMatrix agent's rows, or in a dense array. """
+
+        Policy.__init__(self, seed)
+        self.c = c
+        self.counts = None
+
+
+    def select(self, values, legal, agent, state, explore=True):
+        if not explore:
+            return self.greedy(values, legal)
+
+        if self.counts is None:
+            if isinstance(agent.qmatrix, SparseQMatrix):
+                self.counts = SparseQMatrix(agent.qmatrix.num_cells, dtype=np.int64)
+            else:
+                self.counts = np.zeros((states.NUM_STATES, 9), dtype=np.int64)
+
+        counts = self.counts[state]
+        total = counts.sum(axis=-1, keepdims=True)
+        bonus = np.where(counts > 0, np.sqrt(np.log(np.maximum(total, 1)) / np.maximum(counts, 1)), np.inf)
+        action = self.greedy(values + self.c * bonus, legal)
+
+        if np.ndim(values) == 1:
+            self.counts[state, action] += 1
+        elif isinstance(self.counts, np.ndarray):
+            np.add.at(self.counts, (state, action), 1)
+        else:
+            for s, a in zip(np.asarray(state).tolist(), action.tolist()):
+                self.counts[s, a] += 1
+        return action
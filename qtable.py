@@ -0,0 +1,187 @@
+import numpy as np
+
+import collections
+
+import states
+
+#########################
+# QMatrix stores that   #
+# keep only reachable   #
+# or visited positions  #
+#########################
+
+NUM_ROWS = len(states.REACHABLE)
+
+# Maps a base-3 state index to its row in CompactQMatrix.values. Indices that are not in
+# states.REACHABLE all map to one extra row of zeros at the end, which is only ever read
+# (e.g. when bootstrapping from a board the training loop reaches after the game is over).
+DENSE_INDEX = np.full(states.NUM_STATES, NUM_ROWS, dtype=np.int32)
+DENSE_INDEX[states.REACHABLE] = np.arange(NUM_ROWS, dtype=np.int32)
+
+
+class CompactQMatrix(object):
+
+    def __init__(self, dtype=np.float32):
+        """ :param dtype: numpy dtype of the stored Q-values
+
+            Stores one row of 9 Q-values per reachable position instead of one per base-3 index, in
+            float32 by default, which takes about 8 times less memory than the dense float64 QMatrix.
+            It is indexed with the same base-3 state index as the dense one, so qmatrix[state, :],
+            qmatrix[state][action], qmatrix[state, action] = value and the fancy indexing used by
+            Agent.qlearning_batch all work as before. """
+
+        self.values = np.zeros((NUM_ROWS + 1, 9), dtype=dtype)
+        self.shape = (states.NUM_STATES, 9)
+        self.dtype = self.values.dtype
+
+
+    @property
+    def nbytes(self):
+        """ Returns the number of bytes used by the stored Q-values. """
+
+        return self.values.nbytes
+
+
+    def __getitem__(self, key):
+        return self.values[self._translate_key(key)]
+
+
+    def __setitem__(self, key, value):
+        key = self._translate_key(key)
+        if np.any(key[0] == NUM_ROWS):
+            raise IndexError("Cannot update the QMatrix for a position that no game can reach.")
+
+        self.values[key] = value
+
+
+    def to_dense(self):
+        """ Returns the Q-values as a dense (3^9, 9) float64 array like Agent.qmatrix. """
+
+        return self.values[DENSE_INDEX].astype(np.float64)
+
+
+    def _translate_key(self, key):
+        """ Replaces the state index (or array of indices) at the front of 'key' with the matching row
+            of 'values'. Always returns a tuple. """
+
+        if isinstance(key, tuple):
+            return (DENSE_INDEX[key[0]],) + key[1:]
+        return (DENSE_INDEX[key],)
+
+
+class SparseQMatrix(object):
+
+    def __init__(self, num_cells=9, max_rows=None, dtype=np.float64):
+        """ :param num_cells: number of cells of the board, i.e. Q-values per row
+            :param max_rows: maximum number of rows kept in memory, or None for no limit
+            :param dtype: numpy dtype of the stored Q-values
+
+            Stores the QMatrix rows in a dictionary keyed by state index, allocating a row the first time
+            it is written to. Rows that were never written read as zeros, so memory grows with the number
+            of states actually visited rather than with the 3^num_cells possible ones, which makes boards
+            larger than 3x3 possible. With 'max_rows', the least recently used row is evicted whenever a
+            new one would go over the limit; an evicted row reads as zeros again. It is indexed in the
+            same ways as the dense QMatrix, including the fancy indexing used by Agent.qlearning_batch. """
+
+        self.rows = collections.OrderedDict()
+        self.num_cells = num_cells
+        self.max_rows = max_rows
+        self.dtype = np.dtype(dtype)
+        self.shape = (3**num_cells, num_cells)
+        self.evictions = 0      # Number of rows evicted so far
+
+        # Returned for rows that are not stored. It is read-only, so it can't be changed by accident.
+        self._zeros = np.zeros(num_cells, dtype=self.dtype)
+        self._zeros.setflags(write=False)
+
+
+    def __len__(self):
+        return len(self.rows)
+
+
+    @property
+    def nbytes(self):
+        """ Returns the number of bytes used by the stored Q-values. """
+
+        return len(self.rows) * self.num_cells * self.dtype.itemsize
+
+
+    def row(self, state):
+        """ :param state: base-3 state index
+
+            Returns the stored row for 'state', or a read-only row of zeros if there is none. """
+
+        row = self.rows.get(state)
+        if row is None:
+            return self._zeros
+        if self.max_rows is not None:
+            self.rows.move_to_end(state)
+        return row
+
+
+    def writable_row(self, state):
+        """ :param state: base-3 state index
+
+            Returns the stored row for 'state', allocating a row of zeros (and evicting the least
+            recently used row if 'max_rows' is reached) if there is none. """
+
+        row = self.rows.get(state)
+        if row is None:
+            if self.max_rows is not None and len(self.rows) >= self.max_rows:
+                self.rows.popitem(last=False)
+                self.evictions += 1
+            row = np.zeros(self.num_cells, dtype=self.dtype)
+            self.rows[state] = row
+        elif self.max_rows is not None:
+            self.rows.move_to_end(state)
+        return row
+
+
+    def __getitem__(self, key):
+        state, columns = self._split_key(key)
+        if np.ndim(state) == 0:
+            return self.row(int(state))[columns]
+
+        state = np.asarray(state).tolist()
+        values = np.array([self.row(s) for s in state], dtype=self.dtype).reshape((len(state), self.num_cells))
+        if len(columns) > 0 and np.ndim(columns[0]) > 0:
+            return values[(np.arange(len(state)),) + columns]
+        return values[(slice(None),) + columns]
+
+
+    def __setitem__(self, key, value):
+        state, columns = self._split_key(key)
+        if np.ndim(state) == 0:
+            self.writable_row(int(state))[columns] = value
+            return
+
+        # Rows are written one at a time in order, so if a row appears more than once the last write
+        # wins, as with a numpy array
+        state = np.asarray(state).tolist()
+        if len(columns) > 0 and np.ndim(columns[0]) > 0:
+            columns = np.broadcast_to(columns[0], (len(state),)).tolist()
+            value = np.broadcast_to(value, (len(state),))
+            for s, column, v in zip(state, columns, value):
+                self.writable_row(s)[column] = v
+        else:
+            value = np.broadcast_to(value, (len(state),) + self._zeros[columns].shape)
+            for s, v in zip(state, value):
+                self.writable_row(s)[columns] = v
+
+
+    def to_dense(self):
+        """ Returns the Q-values as a dense (3^num_cells, num_cells) float64 array like Agent.qmatrix.
+            This is only practical for 3x3 boards. """
+
+        dense = np.zeros(self.shape)
+        for state, row in self.rows.items():
+            dense[state] = row
+        return dense
+
+
+    def _split_key(self, key):
+        """ Splits 'key' into the state index (or array of indices) and a tuple of the remaining indices. """
+
+        if isinstance(key, tuple):
+            return key[0], key[1:]
+        return key, ()
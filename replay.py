@@ -0,0 +1,197 @@
+import numpy as np
+
+from agent import Agent
+import symmetry
+
+############################
+# Experience replay with a #
+# ring buffer              #
+############################
+
+
+class ReplayBuffer(object):
+
+    def __init__(self, capacity, seed=None):
+        """ :param capacity: maximum number of transitions kept
+            :param seed: seed for the buffer's own numpy generator, or None to use numpy's global one
+
+            Ring buffer of (state, action, reward, next_state, done) transitions stored in preallocated
+            numpy arrays. Once it is full, each new transition overwrites the oldest one. State indices are
+            stored as int64, which covers boards up to 6x6. """
+
+        self.capacity = capacity
+        self.states = np.zeros(capacity, dtype=np.int64)
+        self.actions = np.zeros(capacity, dtype=np.int16)
+        self.rewards = np.zeros(capacity, dtype=np.float64)
+        self.next_states = np.zeros(capacity, dtype=np.int64)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.position = 0   # Where the next transition is written
+        self.size = 0       # Number of transitions stored
+        self.rng = np.random if seed is None else np.random.RandomState(seed)
+
+
+    def __len__(self):
+        return self.size
+
+
+    def add(self, state, action, reward, next_state, done):
+        """ Stores one transition. """
+
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+
+    def add_batch(self, state, action, reward, next_state, done):
+        """ Stores a batch of transitions given as arrays (rewards and dones may also be scalars). """
+
+        count = len(state)
+        if count > self.capacity:
+            # Only the last 'capacity' transitions would survive anyway
+            skip = count - self.capacity
+            state, action, next_state = state[skip:], action[skip:], next_state[skip:]
+            reward = reward[skip:] if np.ndim(reward) > 0 else reward
+            done = done[skip:] if np.ndim(done) > 0 else done
+            count = self.capacity
+
+        index = (self.position + np.arange(count)) % self.capacity
+        self.states[index] = state
+        self.actions[index] = action
+        self.rewards[index] = reward
+        self.next_states[index] = next_state
+        self.dones[index] = done
+        self.position = (self.position + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+
+
+    def sample(self, batch_size):
+        """ :param batch_size: number of transitions to draw
+
+            Returns arrays (states, actions, rewards, next_states, dones) of 'batch_size' transitions drawn
+            uniformly at random, with replacement, from those stored. """
+
+        index = self.rng.randint(0, self.size, size=batch_size)
+        return self.states[index], self.actions[index], self.rewards[index], self.next_states[index], self.dones[index]
+
+
+def replay_update(agent, batch):
+    """ :param agent: Agent object
+        :param batch: tuple of arrays returned by ReplayBuffer.sample
+
+        Applies the Qlearning update of Agent.update_qmatrix to every transition of 'batch' at once. The
+        TD errors are computed from the current Q-values and accumulated per (state, action) pair with
+        np.bincount, so a pair drawn several times moves by eta times its mean TD error, rather than only
+        one of its updates being kept. Terminal transitions do not bootstrap from next_state. """
+
+    state, action, reward, next_state, done = batch
+    num_actions = agent.qmatrix.shape[1]
+
+    target = reward + agent.gamma * np.where(done, 0.0, np.max(agent.qmatrix[next_state], axis=-1))
+    td_error = target - agent.qmatrix[state, action]
+
+    pairs, inverse = np.unique(state * num_actions + action, return_inverse=True)
+    mean_error = np.bincount(inverse, weights=td_error) / np.bincount(inverse)
+    rows, columns = pairs // num_actions, pairs % num_actions
+    delta = agent.eta * mean_error
+    agent.qmatrix[rows, columns] = agent.qmatrix[rows, columns] + delta
+    agent.convergence.observe(rows, delta)
+
+
+class ReplayAgent(Agent):
+
+    def __init__(self, eta, gamma, epsilon, buffer_size=100000, batch_size=64, replay_ratio=4.0, seed=None, **kwargs):
+        """ :param buffer_size: number of transitions kept in the ReplayBuffer
+            :param batch_size: number of transitions per replayed minibatch
+            :param replay_ratio: number of transitions replayed per new transition, e.g. 4.0 replays a
+                                 minibatch every batch_size / 4 transitions
+            :param seed: seed for the buffer's sampling, or None to use numpy's global generator
+            :param kwargs: passed on to Agent, e.g. compact=True
+
+            Agent that learns from a ReplayBuffer as well as from the updates made by qlearning and
+            qlearning_batch, which are applied as usual. The buffer holds whole moves of the game: from a
+            state where the agent is to move, through the agent's action and the opponent's reply, to the
+            next state where the agent is to move (or the end of the game). Unlike the afterstate that
+            update_qmatrix bootstraps from, that next state is one whose row the agent actually learns, so
+            replaying the moves propagates values back through the game. Once the buffer holds at least
+            one minibatch, replay_update is run often enough to replay 'replay_ratio' moves per new one. """
+
+        Agent.__init__(self, eta, gamma, epsilon, **kwargs)
+        self.buffer = ReplayBuffer(buffer_size, seed=seed)
+        self.batch_size = batch_size
+        self.replay_ratio = replay_ratio
+        self.replays = 0            # Number of minibatches replayed
+        self._owed = 0.0            # Moves owed to the replay since the last minibatch
+        self._pending = None        # (state, action) of qlearning's last move, while its game goes on
+        self._batch_updates = None  # Updates made during qlearning_batch
+
+
+    def update_qmatrix(self, state, action, reward, new_state):
+        """ Same as Agent.update_qmatrix. Also records the move(s) for the ReplayBuffer. """
+
+        Agent.update_qmatrix(self, state, action, reward, new_state)
+
+        if np.ndim(state) > 0:
+            if self._batch_updates is not None:
+                self._batch_updates.append((state, action, reward))
+            return
+
+        # qlearning updates a move once when the agent makes it and, if the opponent's reply ends the game,
+        # once more for the same (state, action). Otherwise the next update is the agent's next move, from
+        # the state where the pending move led.
+        if self._pending is not None and self._pending != (state, action):
+            self._store(self._pending[0], self._pending[1], 0.0, state, False)
+            self._pending = None
+
+        if reward != 0 or self._pending is not None:
+            # The agent won or drew with this move, or the opponent's reply to the pending move ended the game
+            self._store(state, action, reward, new_state, True)
+            self._pending = None
+        else:
+            self._pending = (state, action)
+
+
+    def qlearning_batch(self, vecgame):
+        """ Same as Agent.qlearning_batch. Also stores every board's move in the ReplayBuffer: moves that
+            ended the game with the state they ended in, and the others with the board's next state. """
+
+        self._batch_updates = []
+        finished = Agent.qlearning_batch(self, vecgame)
+        updates, self._batch_updates = self._batch_updates, None
+
+        state, action, reward = updates[0]
+        ended_by_agent = reward != 0
+        self._store(state[ended_by_agent], action[ended_by_agent], reward[ended_by_agent], state[ended_by_agent], True)
+        if len(updates) > 1:
+            # Moves after which the opponent's reply ended the game
+            self._store(updates[1][0], updates[1][1], updates[1][2], updates[1][0], True)
+
+        going = ~finished
+        next_state = vecgame.states[going]
+        if self.symmetric:
+            next_state = symmetry.CANONICAL[next_state]
+        self._store(state[going], action[going], 0.0, next_state, False)
+
+        return finished
+
+
+    def _store(self, state, action, reward, next_state, done):
+        """ Adds one move (or an array of them) to the buffer and replays the minibatches now owed. For a
+            move that ended the game, 'next_state' is not used since it is never bootstrapped from. """
+
+        if np.ndim(state) == 0:
+            self.buffer.add(state, action, reward, next_state, done)
+            self._owed += self.replay_ratio
+        else:
+            self.buffer.add_batch(state, action, reward, next_state, done)
+            self._owed += self.replay_ratio * len(state)
+
+        if len(self.buffer) >= self.batch_size:
+            while self._owed >= self.batch_size:
+                replay_update(self, self.buffer.sample(self.batch_size))
+                self.replays += 1
+                self._owed -= self.batch_size
@@ -0,0 +1,229 @@
+import numpy as np
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import time
+
+from agent import Agent
+from checkpoint import META_FILE
+from deltalog import is_delta_log, load_checkpoint
+from game import make_game
+from value_iteration import train_value_iteration
+
+##########################
+# Asyncio server playing #
+# many games at once     #
+##########################
+
+# Line protocol. Each request is one line of text, answered by one line:
+#   NEW [agent|user]   start a new game, with the agent (default) or the user moving first
+#   MOVE row,col       make the user's move (0-based, as in play_against_user) and get the agent's reply
+#   BOARD              show the current game
+#   STATS              server statistics as one line of JSON
+#   QUIT               close the connection
+# NEW, MOVE and BOARD answer "OK <board> <status> <latency>", where <board> is the nine cells row by
+# row as '.', 'X' (the agent) or 'O' (the user), <status> is 'playing', 'agent', 'user' or 'draw',
+# and <latency> is the time the agent took to choose and make its move, in microseconds (0 if it
+# didn't move). Errors are answered with "ERR <message>".
+
+SYMBOLS = ('.', 'X', 'O')
+GREETING = "HELLO tictactoe 1"
+
+
+class Session(object):
+
+    def __init__(self, backend):
+        """ :param backend: name of one of the classes in game.GAME_BACKENDS
+
+            State of one connection: its own game and whether a game is in progress. """
+
+        self.game = make_game(backend)
+        self.status = None      # None before the first NEW, then 'playing', 'agent', 'user' or 'draw'
+
+
+class GameServer(object):
+
+    def __init__(self, agent, backend='table', latency_window=100000):
+        """ :param agent: trained Agent object, shared by every session and never updated
+            :param backend: game backend for the sessions' games
+            :param latency_window: number of recent agent moves kept for the latency statistics
+
+            Hosts any number of concurrent games against 'agent'. Sessions only hold their own game, and the
+            agent plays greedily with Agent.play_game, so the QMatrix is never copied (a memory-mapped,
+            read-only one from checkpoint.load_agent works). """
+
+        self.agent = agent
+        self.backend = backend
+        self.active_sessions = 0
+        self.total_sessions = 0
+        self.games = 0
+        self.moves = 0
+        self.latencies = collections.deque(maxlen=latency_window)   # Seconds per agent move
+        self.start_time = time.perf_counter()
+
+
+    async def handle(self, reader, writer):
+        """ Serves one connection until it sends QUIT or closes. """
+
+        session = Session(self.backend)
+        self.active_sessions += 1
+        self.total_sessions += 1
+        try:
+            writer.write((GREETING + "\n").encode())
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = line.decode().strip()
+                if request.upper() == "QUIT":
+                    break
+                writer.write((self.respond(session, request) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.active_sessions -= 1
+            writer.close()
+
+
+    def respond(self, session, request):
+        """ :param session: Session object
+            :param request: one line of the protocol
+
+            Carries out the request and returns the response line. """
+
+        parts = request.split()
+        if len(parts) == 0:
+            return "ERR empty request"
+        command = parts[0].upper()
+
+        if command == "NEW":
+            first = parts[1].lower() if len(parts) > 1 else "agent"
+            if first not in ("agent", "user"):
+                return "ERR NEW takes 'agent' or 'user'"
+            session.game.reset_board()
+            session.status = "playing"
+            self.games += 1
+            latency = self.agent_move(session) if first == "agent" else 0.0
+            return self.board_response(session, latency)
+
+        elif command == "MOVE":
+            if session.status != "playing":
+                return "ERR no game in progress, send NEW"
+            try:
+                row, col = (int(value) for value in "".join(parts[1:]).split(','))
+            except ValueError:
+                return "ERR MOVE takes row,col"
+            if not (0 <= row < session.game.size and 0 <= col < session.game.size):
+                return "ERR move out of range"
+            if not session.game.make_move((row, col), 'O'):
+                return "ERR position is taken"
+
+            latency = 0.0
+            if session.game.has_opponent_won():
+                session.status = "user"
+            elif session.game.is_it_a_draw():
+                session.status = "draw"
+            else:
+                latency = self.agent_move(session)
+            return self.board_response(session, latency)
+
+        elif command == "BOARD":
+            if session.status is None:
+                return "ERR no game yet, send NEW"
+            return self.board_response(session, 0.0)
+
+        elif command == "STATS":
+            return json.dumps(self.stats())
+
+        return "ERR unknown command '{}'".format(parts[0])
+
+
+    def agent_move(self, session):
+        """ Makes the agent's move in the session's game, updates its status and returns the time taken. """
+
+        start = time.perf_counter()
+        self.agent.play_game(session.game)
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        self.moves += 1
+
+        if session.game.has_agent_won():
+            session.status = "agent"
+        elif session.game.is_it_a_draw():
+            session.status = "draw"
+        return latency
+
+
+    def board_response(self, session, latency):
+        cells = np.asarray(session.game.board).ravel().astype(int)
+        board = "".join(SYMBOLS[cell] for cell in cells)
+        return "OK {} {} {:.1f}".format(board, session.status, latency * 1e6)
+
+
+    def stats(self):
+        """ Returns a dictionary of session and game counts and the agent's per-move latency percentiles
+            (in microseconds) over the last 'latency_window' moves. """
+
+        stats = {'active_sessions': self.active_sessions,
+                 'total_sessions': self.total_sessions,
+                 'games': self.games,
+                 'agent_moves': self.moves,
+                 'uptime': time.perf_counter() - self.start_time}
+        if self.latencies:
+            latencies = np.array(self.latencies) * 1e6
+            for name, q in (('p50', 50), ('p90', 90), ('p99', 99), ('p999', 99.9)):
+                stats['latency_' + name + '_us'] = float(np.percentile(latencies, q))
+            stats['latency_max_us'] = float(latencies.max())
+        return stats
+
+
+async def serve(server, host="127.0.0.1", port=8765, unix_path=None):
+    """ :param server: GameServer object
+        :param host: address to listen on
+        :param port: TCP port to listen on
+        :param unix_path: path of a UNIX socket to listen on instead of TCP, or None
+
+        Runs 'server' until cancelled. """
+
+    if unix_path is not None:
+        listener = await asyncio.start_unix_server(server.handle, path=unix_path)
+        print("Serving on {}".format(unix_path))
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+        print("Serving on {}:{}".format(host, port))
+
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve tic-tac-toe games against a trained agent.")
+    parser.add_argument('--checkpoint', default="agent_checkpoint",
+                        help="checkpoint directory to load the agent from. If there is none, the agent is "
+                             "trained with value iteration instead.")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="listen on this UNIX socket instead of TCP")
+    parser.add_argument('--backend', default='table', help="game backend for the sessions (default 'table')")
+    args = parser.parse_args()
+
+    if os.path.exists(os.path.join(args.checkpoint, META_FILE)) or is_delta_log(args.checkpoint):
+        agent, _ = load_checkpoint(args.checkpoint)
+        print("Loaded the agent from '{}'.".format(args.checkpoint))
+    else:
+        agent = Agent(eta=0.5, gamma=0.9, epsilon=1.0)
+        _, seconds = train_value_iteration(agent)
+        print("No checkpoint in '{}'; trained the agent with value iteration in {:.3f} s.".format(args.checkpoint, seconds))
+
+    try:
+        asyncio.run(serve(GameServer(agent, args.backend), args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
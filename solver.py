@@ -0,0 +1,176 @@
+import numpy as np
+
+import random
+
+import states
+
+############################
+# Exact tic-tac-toe solver #
+# (negamax, alpha-beta)    #
+############################
+
+# Players are given by their index in states.SUCCESSOR: 0 for 'X' (the agent), 1 for 'O' (the opponent)
+X = 0
+O = 1
+
+# Order in which moves are searched: centre, corners, then edges. Good moves first means more cutoffs.
+MOVE_ORDER = (4, 0, 2, 6, 8, 1, 3, 5, 7)
+
+# Kinds of transposition table entries
+EXACT = 0
+LOWER = 1   # The value is at least the stored one
+UPPER = 2   # The value is at most the stored one
+
+# Transposition table mapping (state index, player to move) to (value, kind). It is filled in as
+# positions are searched and kept for the life of the program, so every position is only ever
+# searched once with a given window.
+TRANSPOSITION_TABLE = {}
+
+_wins = (states.X_WINS_LIST, states.O_WINS_LIST)
+
+
+def negamax(state, player, alpha=-1, beta=1):
+    """ :param state: base-3 state index
+        :param player: X or O, the player to move
+        :param alpha: lower bound of the search window
+        :param beta: upper bound of the search window
+
+        Returns the game-theoretic value of the position for the player to move: 1 if they can force a win,
+        0 if the best they can force is a draw and -1 if they lose against best play. With the full window
+        (-1, 1) the value is exact; with a narrower window it is only a bound once it falls outside it. """
+
+    key = (state, player)
+    entry = TRANSPOSITION_TABLE.get(key)
+    if entry is not None:
+        value, kind = entry
+        if kind == EXACT:
+            return value
+        elif kind == LOWER:
+            alpha = max(alpha, value)
+        else:
+            beta = min(beta, value)
+        if alpha >= beta:
+            return value
+
+    other = 1 - player
+    if _wins[other][state]:
+        TRANSPOSITION_TABLE[key] = (-1, EXACT)
+        return -1
+    if _wins[player][state]:
+        TRANSPOSITION_TABLE[key] = (1, EXACT)
+        return 1
+    if states.FULL_LIST[state]:
+        TRANSPOSITION_TABLE[key] = (0, EXACT)
+        return 0
+
+    original_alpha = alpha
+    successors = states.SUCCESSOR_LIST[state][player]
+    best = -2
+    for cell in MOVE_ORDER:
+        next_state = successors[cell]
+        if next_state < 0:
+            continue
+
+        value = -negamax(next_state, other, -beta, -alpha)
+        if value > best:
+            best = value
+            if value > alpha:
+                alpha = value
+                if alpha >= beta:
+                    break
+
+    if best <= original_alpha:
+        TRANSPOSITION_TABLE[key] = (best, UPPER)
+    elif best >= beta:
+        TRANSPOSITION_TABLE[key] = (best, LOWER)
+    else:
+        TRANSPOSITION_TABLE[key] = (best, EXACT)
+    return best
+
+
+def move_values(state, player):
+    """ :param state: base-3 state index
+        :param player: X or O, the player to move
+
+        Returns a list of 9 exact values, one per cell, of making that move for the player to move
+        (None for occupied cells). """
+
+    other = 1 - player
+    successors = states.SUCCESSOR_LIST[state][player]
+    return [None if next_state < 0 else -negamax(next_state, other) for next_state in successors]
+
+
+def optimal_moves(state, player):
+    """ :param state: base-3 state index
+        :param player: X or O, the player to move
+
+        Returns the list of cells whose moves keep the best value the player to move can achieve. """
+
+    values = move_values(state, player)
+    best = max(value for value in values if value is not None)
+    return [cell for cell, value in enumerate(values) if value == best]
+
+
+def minimax_opponent(epsilon=0.0, seed=None):
+    """ :param epsilon: float between [0.0, 1.0], the probability of a random move instead of an optimal one
+        :param seed: seed for the opponent's own random generator, or None to use the random module
+
+        Returns a function that can be used in place of tictactoe.opponent_moves. It plays 'O' optimally,
+        choosing at random between equally good moves, except that with probability 'epsilon' it plays a
+        uniformly random move instead. With epsilon=0.0 it never loses a game where the players take turns. """
+
+    rng = random if seed is None else random.Random(seed)
+
+    def opponent(game):
+        actions = game.get_possible_next_moves()
+        if len(actions) == 0:
+            return
+
+        if epsilon > 0.0 and rng.random() < epsilon:
+            action = rng.choice(actions)
+        else:
+            cell = rng.choice(optimal_moves(game.translate_board_state_to_index(), O))
+            action = (cell // 3, cell % 3)
+        game.make_move(position=action, player='O')
+
+    return opponent
+
+
+def agent_states():
+    """ Returns an array of the reachable, non-terminal state indices where the agent ('X') can be the
+        player to move, i.e. where it has as many pieces as the opponent or one fewer. """
+
+    reachable = states.REACHABLE[~states.TERMINAL[states.REACHABLE]]
+    num_x = np.count_nonzero(states.CELLS[reachable] == 1, axis=1)
+    num_o = np.count_nonzero(states.CELLS[reachable] == 2, axis=1)
+    return reachable[(num_x == num_o) | (num_x + 1 == num_o)]
+
+
+def agent_optimality(agent):
+    """ :param agent: Agent object
+
+        Checks the agent's greedy move against the solver in every state where the agent can be the
+        player to move. A state counts as 'optimal' if every move the agent might choose greedily
+        (every legal move with the highest Q-value) is game-theoretically optimal. States where all
+        legal moves have the same Q-value, so that the agent just picks one at random, are counted
+        as 'untrained' as well. Returns a dictionary with the number of 'states', the number that
+        are 'optimal' and 'untrained', and the 'optimal_fraction'. """
+
+    positions = agent_states()
+    values = agent.action_values(positions)
+    legal = states.CELLS[positions] == 0
+    masked = np.where(legal, values, -np.inf)
+    greedy = legal & (masked == masked.max(axis=1, keepdims=True))
+
+    optimal = 0
+    untrained = 0
+    for i, state in enumerate(positions.tolist()):
+        best = np.zeros(9, dtype=bool)
+        best[optimal_moves(state, X)] = True
+        if not np.any(greedy[i] & ~best):
+            optimal += 1
+        if np.array_equal(greedy[i], legal[i]):
+            untrained += 1
+
+    return {'states': len(positions), 'optimal': optimal, 'untrained': untrained,
+            'optimal_fraction': optimal / len(positions)}
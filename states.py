@@ -0,0 +1,143 @@
+import numpy as np
+import os
+import tempfile
+import zipfile
+
+#########################
+# Precomputed tables of #
+# tic-tac-toe states    #
+#########################
+
+# Every board maps to the base-3 index used by Game.translate_board_state_to_index(), so each
+# table below has one row per index. The rows cover every index, not just the legal positions,
+# because the training loop can reach boards a normal game never would (e.g. the opponent
+# moving again after it has already won). REACHABLE lists the positions of actual games.
+
+NUM_STATES = 3**9
+NUM_CELLS = 9
+CACHE_VERSION = 1
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "states.npz")
+
+
+def generate_lines(size, win_length):
+    """ :param size: number of rows and columns of the board
+        :param win_length: number of pieces in a row needed to win
+
+        Returns every winning line of a (size x size) board as a tuple of 'win_length' cells, where cell
+        (i, j) is size*i + j: the horizontal, vertical, diagonal and anti-diagonal runs, in that order. """
+
+    lines = []
+    for di, dj in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        for i in range(size):
+            for j in range(size):
+                end_i = i + di * (win_length - 1)
+                end_j = j + dj * (win_length - 1)
+                if 0 <= end_i < size and 0 <= end_j < size:
+                    lines.append(tuple(size * (i + di * k) + (j + dj * k) for k in range(win_length)))
+    return tuple(lines)
+
+
+# The eight winning lines of tic-tac-toe as triples of cells, where cell (i, j) is 3*i + j
+LINES = generate_lines(3, 3)
+
+
+def build_tables():
+    """ Builds every table from scratch and returns them in a dictionary of numpy arrays:
+
+        cells: (NUM_STATES, 9) value in each cell, 0 for empty, 1 for 'X' and 2 for 'O'
+        x_wins, o_wins: whether 'X' / 'O' has three in a row
+        full: whether the board has no empty cells left
+        terminal: whether either player has won or the board is full
+        winner: 0 for no winner, 1 for 'X', 2 for 'O' (3 if both have a line, which no real game reaches)
+        legal_mask: 9-bit mask of the empty cells, bit 'cell' set if 'cell' is empty
+        successor: (NUM_STATES, 2, 9) index after 'X' (0) or 'O' (1) moves into a cell, -1 if it is occupied
+        reachable: sorted indices of every position reachable in a game where either player moves first """
+
+    index = np.arange(NUM_STATES)
+    powers = 3 ** np.arange(NUM_CELLS)
+    cells = ((index[:, None] // powers) % 3).astype(np.int8)
+
+    lines = np.array(LINES)
+    x_wins = np.all(cells[:, lines] == 1, axis=2).any(axis=1)
+    o_wins = np.all(cells[:, lines] == 2, axis=2).any(axis=1)
+    empty = cells == 0
+    full = ~empty.any(axis=1)
+    terminal = x_wins | o_wins | full
+    winner = (x_wins * 1 + o_wins * 2).astype(np.int8)
+    legal_mask = (empty * (1 << np.arange(NUM_CELLS))).sum(axis=1).astype(np.int16)
+
+    successor = np.full((NUM_STATES, 2, NUM_CELLS), -1, dtype=np.int32)
+    successor[:, 0, :] = np.where(empty, index[:, None] + powers, -1)
+    successor[:, 1, :] = np.where(empty, index[:, None] + 2 * powers, -1)
+
+    # Walk the game tree one ply at a time, once with 'X' moving first and once with 'O' moving first
+    reached = [np.array([0])]
+    for first in (0, 1):
+        frontier = np.array([0])
+        player = first
+        while len(frontier) > 0:
+            frontier = frontier[~terminal[frontier]]
+            frontier = successor[frontier, player, :].ravel()
+            frontier = np.unique(frontier[frontier >= 0])
+            reached.append(frontier)
+            player = 1 - player
+    reachable = np.unique(np.concatenate(reached)).astype(np.int32)
+
+    return {'cells': cells, 'x_wins': x_wins, 'o_wins': o_wins, 'full': full, 'terminal': terminal,
+            'winner': winner, 'legal_mask': legal_mask, 'successor': successor, 'reachable': reachable}
+
+
+def load_tables(path=CACHE_PATH):
+    """ :param path: path of the .npz cache file, or None to skip the cache
+
+        Returns the tables from build_tables(), reading them from 'path' if it holds a cache with the
+        current CACHE_VERSION. Otherwise (including when the file is truncated or corrupt) the tables are
+        built and written to 'path' for next time. Each process writes to its own temporary file and
+        renames it into place, so processes building the cache at the same time never see or clobber a
+        half-written file. If the cache cannot be written (e.g. a read-only install), the freshly built
+        tables are still returned. """
+
+    if path is not None and os.path.exists(path):
+        try:
+            with np.load(path) as cached:
+                if int(cached['version']) == CACHE_VERSION:
+                    return {name: cached[name] for name in cached.files if name != 'version'}
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            pass
+
+    tables = build_tables()
+    if path is not None:
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp.npz", dir=os.path.dirname(os.path.abspath(path)))
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, version=CACHE_VERSION, **tables)
+            os.replace(tmp_path, path)
+        except OSError:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return tables
+
+
+_tables = load_tables()
+
+CELLS = _tables['cells']
+X_WINS = _tables['x_wins']
+O_WINS = _tables['o_wins']
+FULL = _tables['full']
+TERMINAL = _tables['terminal']
+WINNER = _tables['winner']
+LEGAL_MASK = _tables['legal_mask']
+SUCCESSOR = _tables['successor']
+REACHABLE = _tables['reachable']
+
+# LEGAL[state] is a boolean mask of the empty cells of the board, i.e. its legal moves
+LEGAL = CELLS == 0
+
+# Python list copies of the tables used for scalar lookups. Indexing a list with an int is
+# several times faster than indexing a numpy array one element at a time.
+X_WINS_LIST = X_WINS.tolist()
+O_WINS_LIST = O_WINS.tolist()
+FULL_LIST = FULL.tolist()
+LEGAL_MASK_LIST = LEGAL_MASK.tolist()
+SUCCESSOR_LIST = SUCCESSOR.tolist()
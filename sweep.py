@@ -0,0 +1,285 @@
+import numpy as np
+
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from agent import Agent
+from assessment import assess_batch
+from game import make_game
+from tictactoe import train
+
+###########################
+# Hyperparameter sweeps   #
+# over a process pool     #
+###########################
+
+# Hyperparameters that a sweep can vary, with the values main() uses. Every trial also has a 'seed'.
+DEFAULTS = {'eta': 0.5, 'gamma': 0.9, 'epsilon': 0.1, 'epsilon_increase': 0.05, 'm': 5000}
+INTEGER_PARAMETERS = ('m',)
+
+
+def grid_configs(space, seeds):
+    """ :param space: dictionary mapping hyperparameter names to lists of values
+        :param seeds: list of integer seeds
+
+        Returns one config (a dictionary of every hyperparameter in DEFAULTS plus 'seed') for each
+        combination of the values in 'space' and each seed. Hyperparameters missing from 'space' keep
+        their default. """
+
+    names = sorted(space)
+    configs = []
+    for values in itertools.product(*(space[name] for name in names)):
+        for seed in seeds:
+            config = dict(DEFAULTS)
+            config.update(zip(names, values))
+            config['seed'] = seed
+            configs.append(config)
+    return configs
+
+
+def random_configs(space, num_trials, seeds, search_seed=0):
+    """ :param space: dictionary mapping hyperparameter names to a list of values to choose from, or to
+                      a (low, high) tuple to draw from uniformly (as an integer for those in INTEGER_PARAMETERS)
+        :param num_trials: number of hyperparameter settings to draw
+        :param seeds: list of integer seeds, each of which is run for every setting
+        :param search_seed: seed for drawing the settings
+
+        Random search. The settings only depend on the arguments, so rerunning a sweep with the same
+        arguments draws the same configs again and finds their results in the cache. """
+
+    rng = random.Random(search_seed)
+    configs = []
+    for _ in range(num_trials):
+        setting = dict(DEFAULTS)
+        for name in sorted(space):
+            values = space[name]
+            if isinstance(values, tuple):
+                low, high = values
+                setting[name] = rng.randint(low, high) if name in INTEGER_PARAMETERS else rng.uniform(low, high)
+            else:
+                setting[name] = rng.choice(values)
+        for seed in seeds:
+            configs.append(dict(setting, seed=seed))
+    return configs
+
+
+def config_key(config):
+    """ Returns the cache key of a trial: a hash of its config, which includes the training settings. """
+
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class ResultsCache(object):
+
+    def __init__(self, path):
+        """ :param path: directory holding one JSON file per finished trial, named after config_key
+
+            On-disk cache of sweep results. A trial's file is written in one step when it finishes (to a
+            temporary file that is then renamed), so an interrupted sweep never leaves partial results,
+            and rerunning it only runs the trials that have no file yet. """
+
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+
+    def file(self, key):
+        return os.path.join(self.path, key + ".json")
+
+
+    def __contains__(self, key):
+        return os.path.exists(self.file(key))
+
+
+    def get(self, key):
+        with open(self.file(key)) as f:
+            return json.load(f)
+
+
+    def put(self, key, result):
+        temporary = self.file(key) + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(result, f)
+        os.replace(temporary, self.file(key))
+
+
+    def results(self):
+        """ Returns every cached result. """
+
+        return [self.get(name[:-len(".json")]) for name in sorted(os.listdir(self.path)) if name.endswith(".json")]
+
+
+def run_trial(config):
+    """ :param config: dictionary of hyperparameters and training settings (see run_sweep)
+
+        Pool task. Trains a new agent with tictactoe.train, recording the assess_agent learning curve (games
+        won out of 10 before training and after each epoch), then scores the agent with assess_batch.
+        Returns the trial's result as a dictionary. """
+
+    random.seed(config['seed'])
+    np.random.seed(config['seed'] % 2**32)
+
+    agent = Agent(eta=config['eta'], gamma=config['gamma'], epsilon=config['epsilon'])
+    game = make_game(config['backend'])
+
+    start = time.perf_counter()
+    agent, y_axis, _ = train(agent, game, num_epochs=config['epochs'], stop=config['games'],
+                             epsilon_increase=config['epsilon_increase'], m=config['m'], num_assessment_games=0)
+    seconds = time.perf_counter() - start
+
+    stats = assess_batch(agent, config['score_games'], seed=config['seed'])['all']
+    return {'key': config_key(config),
+            'config': config,
+            'y_axis': y_axis,
+            'win_rate': stats['win_rate'],
+            'draw_rate': stats['draw_rate'],
+            'loss_rate': stats['loss_rate'],
+            'training_games': agent.training_games,
+            'seconds': seconds}
+
+
+def _pool_context():
+    """ Returns the multiprocessing context for the worker pool. Forked workers share the state tables
+        already loaded by this process (states, kernel and game build them on import), so starting a
+        worker or a trial costs no table building. Where fork is unavailable, each worker loads the
+        tables once, from the states.npz cache, when it imports this module. """
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def run_sweep(configs, cache_path, num_workers=None, epochs=10, games=10000, backend='table', score_games=10000,
+              verbose=True):
+    """ :param configs: list of configs from grid_configs or random_configs
+        :param cache_path: directory of the ResultsCache
+        :param num_workers: number of worker processes, or None for one per CPU
+        :param epochs: training epochs per trial
+        :param games: training games per epoch
+        :param backend: game backend used for training
+        :param score_games: number of greedy games against the random agent that each trained agent is
+                            scored with
+        :param verbose: if True, print each trial's result as it finishes
+
+        Runs every trial whose result is not in the cache yet on a process pool, caching each result as it
+        comes in. The training settings are part of each trial's config (and so of its cache key). Returns
+        the results of all of the trials, in the order of 'configs'. """
+
+    cache = ResultsCache(cache_path)
+    configs = [dict(config, epochs=epochs, games=games, backend=backend, score_games=score_games) for config in configs]
+    keys = [config_key(config) for config in configs]
+
+    pending = {}
+    for key, config in zip(keys, configs):
+        if key not in cache:
+            pending[key] = config
+    if verbose:
+        print("{} trials, {} already cached, {} to run.".format(len(configs), len(configs) - len(pending), len(pending)))
+
+    if pending:
+        num_workers = min(num_workers or os.cpu_count() or 1, len(pending))
+        start = time.perf_counter()
+        with _pool_context().Pool(num_workers) as pool:
+            for i, result in enumerate(pool.imap_unordered(run_trial, list(pending.values()))):
+                cache.put(result['key'], result)
+                if verbose:
+                    print("[{}/{}] {}  win rate {:.4f}  ({:.1f}s)".format(
+                          i + 1, len(pending), describe(result['config']), result['win_rate'], result['seconds']))
+        if verbose:
+            print("Ran {} trials in {:.1f}s.".format(len(pending), time.perf_counter() - start))
+
+    return [cache.get(key) for key in keys]
+
+
+def describe(config):
+    """ Returns the hyperparameters and seed of a config as a short string. """
+
+    return " ".join("{}={:g}".format(name, config[name]) for name in sorted(DEFAULTS) + ['seed'])
+
+
+def summarize(results):
+    """ :param results: list of trial results
+
+        Groups the trials by their hyperparameters (i.e. over seeds) and returns a list of dictionaries
+        with the hyperparameters, the number of 'seeds', the 'mean_win_rate' and 'std_win_rate', and the
+        'mean_curve' (the average assess_agent learning curve), best first. """
+
+    groups = {}
+    for result in results:
+        setting = tuple((name, result['config'][name]) for name in sorted(DEFAULTS))
+        groups.setdefault(setting, []).append(result)
+
+    summary = []
+    for setting, trials in groups.items():
+        win_rates = np.array([trial['win_rate'] for trial in trials])
+        row = dict(setting)
+        row.update({'seeds': len(trials),
+                    'mean_win_rate': float(win_rates.mean()),
+                    'std_win_rate': float(win_rates.std()),
+                    'mean_curve': np.mean([trial['y_axis'] for trial in trials], axis=0).tolist()})
+        summary.append(row)
+
+    summary.sort(key=lambda row: row['mean_win_rate'], reverse=True)
+    return summary
+
+
+def parse_values(text, name):
+    """ Parses a command line value list: 'a,b,c' for a list of values, or 'low:high' for a range that
+        random search draws from. """
+
+    cast = int if name in INTEGER_PARAMETERS else float
+    if ':' in text:
+        low, high = text.split(':')
+        return (cast(low), cast(high))
+    return [cast(value) for value in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep the Q-learning hyperparameters over a process pool.")
+    for name, value in sorted(DEFAULTS.items()):
+        parser.add_argument('--' + name.replace('_', '-'), dest=name,
+                            help="comma-separated values, or low:high for random search (default {})".format(value))
+    parser.add_argument('--search', choices=('grid', 'random'), default='grid')
+    parser.add_argument('--trials', type=int, default=20, help="settings drawn by random search (default 20)")
+    parser.add_argument('--search-seed', type=int, default=0, help="seed for drawing the random search settings")
+    parser.add_argument('--seeds', default="0", help="comma-separated training seeds, each run for every setting")
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--games', type=int, default=10000, help="training games per epoch")
+    parser.add_argument('--backend', default='table')
+    parser.add_argument('--score-games', type=int, default=10000,
+                        help="greedy games against the random agent used to score each trained agent")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--cache', default="sweep_cache", help="directory of cached trial results")
+    parser.add_argument('--top', type=int, default=10, help="number of settings to print")
+    args = parser.parse_args()
+
+    space = {}
+    for name in DEFAULTS:
+        if getattr(args, name) is not None:
+            space[name] = parse_values(getattr(args, name), name)
+    seeds = [int(seed) for seed in args.seeds.split(',')]
+
+    if args.search == 'grid':
+        if any(isinstance(values, tuple) for values in space.values()):
+            parser.error("ranges (low:high) are only allowed with --search random")
+        configs = grid_configs(space, seeds)
+    else:
+        configs = random_configs(space, args.trials, seeds, args.search_seed)
+
+    results = run_sweep(configs, args.cache, num_workers=args.workers, epochs=args.epochs, games=args.games,
+                        backend=args.backend, score_games=args.score_games)
+
+    print("\nBest settings:")
+    for row in summarize(results)[:args.top]:
+        print("{}  seeds {}  win rate {:.4f} +/- {:.4f}  wins out of 10: {}".format(
+              " ".join("{}={:g}".format(name, row[name]) for name in sorted(DEFAULTS)), row['seeds'],
+              row['mean_win_rate'], row['std_win_rate'], " ".join("{:.1f}".format(v) for v in row['mean_curve'])))
+
+
+if __name__ == '__main__':
+    main()
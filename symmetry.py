@@ -0,0 +1,40 @@
+import numpy as np
+
+import states
+
+##########################
+# Board symmetries (D4)  #
+# for tic-tac-toe states #
+##########################
+
+# The eight rotations and reflections of the board as permutations of the cells, where cell
+# (i, j) is 3*i + j. PERMUTATIONS[t][cell] is the cell that 'cell' is moved to by symmetry t.
+# Symmetry 0 is the identity.
+PERMUTATIONS = np.array([[3 * i + j for i in range(3) for j in range(3)],              # Identity
+                         [3 * j + (2 - i) for i in range(3) for j in range(3)],        # Rotate 90
+                         [3 * (2 - i) + (2 - j) for i in range(3) for j in range(3)],  # Rotate 180
+                         [3 * (2 - j) + i for i in range(3) for j in range(3)],        # Rotate 270
+                         [3 * i + (2 - j) for i in range(3) for j in range(3)],        # Flip left-right
+                         [3 * (2 - i) + j for i in range(3) for j in range(3)],        # Flip up-down
+                         [3 * j + i for i in range(3) for j in range(3)],              # Transpose
+                         [3 * (2 - j) + (2 - i) for i in range(3) for j in range(3)]]) # Anti-transpose
+
+NUM_SYMMETRIES = len(PERMUTATIONS)
+
+# Index of every board under every symmetry, shape (8, 3^9)
+_images = (states.CELLS[None, :, :].astype(np.int64) * 3**PERMUTATIONS[:, None, :]).sum(axis=2)
+
+# CANONICAL[state] is the smallest index among the eight images of the board, and
+# TRANSFORM[state] is a symmetry that takes the board to it
+CANONICAL = _images.min(axis=0).astype(np.int32)
+TRANSFORM = _images.argmin(axis=0).astype(np.int8)
+
+# TO_CANONICAL[t][cell] moves a cell into the canonical frame of a board with TRANSFORM t,
+# and FROM_CANONICAL[t][cell] moves it back
+TO_CANONICAL = PERMUTATIONS
+FROM_CANONICAL = np.argsort(PERMUTATIONS, axis=1)
+
+# Python list copies for scalar lookups, as in states.py
+CANONICAL_LIST = CANONICAL.tolist()
+TRANSFORM_LIST = TRANSFORM.tolist()
+FROM_CANONICAL_LIST = FROM_CANONICAL.tolist()
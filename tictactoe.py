@@ -1,11 +1,21 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
+import os
 import random
+import sys
+import time
 from datetime import datetime
 
 from agent import Agent
-from game import Game
+from assessment import assess_batch
+from checkpoint import META_FILE, load_agent, save_agent
+from convergence import ConvergenceTracker
+from deltalog import DeltaLog
+from episodes import EpisodeRecorder, RecordingGame
+from game import make_game
+from instrument import STATS, start_profile, stop_profile
+from kernel import supports, train_games
+from vecgame import VecGame
 
 
 # Hannah Galbraith
@@ -30,26 +40,29 @@ def opponent_moves(game):
         game.make_move(position=action, player='O')
 
 
-def train_agent(player, agent, game):
+def train_agent(player, agent, game, opponent=None):
     """ :param player: 'X' or 'O'
         :param agent: Agent object
         :param game: Game object
+        :param opponent: function that makes the opponent's move on 'game', or None for opponent_moves
         
         Functioned invoked during training of the agent. Plays one round of tic-tac-toe. If agent.qlearning 
         returns True, then game is done and method returns 'done' to the calling routine. Otherwise, it returns
         'in progress'. """
 
     result = "in progress"
+    if opponent is None:
+        opponent = opponent_moves
 
     if player == 'X':
         done = agent.qlearning(game)
         if not done:
-            opponent_moves(game)
+            opponent(game)
         else:
             result = "done"
             game.reset_board()
     else:
-        opponent_moves(game)
+        opponent(game)
         done = agent.qlearning(game)
         if done:
             result = "done"  
@@ -58,10 +71,27 @@ def train_agent(player, agent, game):
     return result
 
 
-def play_game(player, agent, game):
+def train_agent_batch(agent, vecgame, num_games):
+    """ :param agent: Agent object
+        :param vecgame: VecGame object
+        :param num_games: integer
+
+        Batched counterpart of train_agent. Calls agent.qlearning_batch on all of vecgame's boards 
+        until at least 'num_games' games have finished and returns the number of games played. """
+
+    games_played = 0
+    while games_played < num_games:
+        done = agent.qlearning_batch(vecgame)
+        games_played += int(np.count_nonzero(done))
+
+    return games_played
+
+
+def play_game(player, agent, game, opponent=None):
     """ :param player: 'X' or 'O'
         :param agent: Agent object
         :param game: Game object
+        :param opponent: function that makes the opponent's move on 'game', or None for opponent_moves
         
         Functioned invoked during assessment of the agent. Plays one round of tic-tac-toe. If agent.play_game 
         returns True, then game is done. Function will determine whether agent has won,
@@ -69,11 +99,13 @@ def play_game(player, agent, game):
         'opponent', or 'draw' and return that to the calling routine. Otherwise, it returns
         'in progress'. """
     result = "in progress"
+    if opponent is None:
+        opponent = opponent_moves
 
     if player == 'X':
         done = agent.play_game(game)
         if not done:
-            opponent_moves(game)
+            opponent(game)
         else:
             if game.has_agent_won() == True:
                 result = "agent"
@@ -84,7 +116,7 @@ def play_game(player, agent, game):
                 
             game.reset_board()
     else:
-        opponent_moves(game)
+        opponent(game)
         done = agent.play_game(game)
         if done:
             if game.has_agent_won() == True:
@@ -99,20 +131,21 @@ def play_game(player, agent, game):
     return result
 
 
-def assess_agent(player, agent, game, y_axis):
+def assess_agent(player, agent, game, y_axis, opponent=None):
     """ :param player: 'X' or 'O'
         :param agent: Agent object
         :param game: Game object
         :param y_axis: list of integers 
+        :param opponent: function that makes the opponent's move on 'game', or None for opponent_moves
         
         Function assesses agent's performance after a given training epoch. Plays 10 games against random agent
-        and records the number of times the agent won. Appends result to 'y_axis' list and returns the 
-        current player and y_axis to the calling routine. """
+        (or 'opponent') and records the number of times the agent won. Appends result to 'y_axis' list and 
+        returns the current player and y_axis to the calling routine. """
 
     num_games = 0
     agent_wins = 0 
     while num_games < 10:
-        result = play_game(player, agent, game)
+        result = play_game(player, agent, game, opponent)
             
         if result == "agent":
             agent_wins += 1
@@ -130,16 +163,59 @@ def assess_agent(player, agent, game, y_axis):
     return player, y_axis
 
 
-def plot_progress(x_axis, y_axis):
+def derive_seed(seed, stream):
+    """ :param seed: integer seed, or None
+        :param stream: integer naming what the seed is for
+
+        Returns a seed for one of the generators of a seeded run, different for every 'stream', or None if
+        'seed' is None. """
+
+    if seed is None:
+        return None
+    return int(np.random.SeedSequence([seed, stream]).generate_state(1)[0])
+
+
+def assess_agent_batch(agent, num_games, assessments, opponent=None, seed=None):
+    """ :param agent: Agent object
+        :param num_games: integer
+        :param assessments: list of dictionaries
+        :param opponent: Opponent object, or None for the random agent
+        :param seed: seed for the opponent and tie-breaking, or None
+
+        Function assesses agent's performance after a given training epoch with assessment.assess_batch,
+        which plays 'num_games' greedy games against the random agent at once. Appends the statistics (win,
+        draw and loss rates with confidence intervals, overall and by whether the agent moved first) to 
+        'assessments' and returns it. """
+
+    assessments.append(assess_batch(agent, num_games, seed=seed, opponent=opponent))
+
+    return assessments
+
+
+def plot_progress(x_axis, y_axis, lower=None, upper=None, ylabel="Number of Winning Games out of 10"):
     """ :param x_axis: list of integers
-        :param y_axis: list of integers
+        :param y_axis: list of numbers
+        :param lower: list of floats, or None
+        :param upper: list of floats, or None
+        :param ylabel: string
         
-        Creates a line graph of agent's progress during training. Saves the plot to a png file. """
-    plt.style.use('seaborn-whitegrid')
+        Creates a line graph of agent's progress during training. If 'lower' and 'upper' are given (e.g. the
+        confidence interval of a win rate from assess_agent_batch), the band between them is shaded. Saves 
+        the plot to a png file. matplotlib is only imported here, so that the rest of the program runs 
+        without it. """
+    import matplotlib.pyplot as plt
+
+    # matplotlib 3.6 renamed the seaborn styles
+    if 'seaborn-whitegrid' in plt.style.available:
+        plt.style.use('seaborn-whitegrid')
+    else:
+        plt.style.use('seaborn-v0_8-whitegrid')
     plt.plot(np.array(x_axis), np.array(y_axis))
+    if lower is not None and upper is not None:
+        plt.fill_between(np.array(x_axis), np.array(lower), np.array(upper), alpha=0.3)
     plt.title("Agent Progress Over Time")
     plt.xlabel("Epoch")
-    plt.ylabel("Number of Winning Games out of 10")
+    plt.ylabel(ylabel)
 
     # This is just a bit of logic to get the filename in the format I want
     fname = "agent_wins_" + str(datetime.now())
@@ -277,49 +353,244 @@ def play_against_user(agent, game):
     print("{} game(s) were a draw.".format(num_draws))
                 
 
-def main():
-    # Initialize instance of the Game and Agent objects
-    game = Game()
-    agent = Agent(eta=0.5, gamma=0.9, epsilon=0.1)
-
-    # Set hyperparameters
-    num_epochs = 10
-    stop = 10000
-    epsilon_increase = 0.05
-    m = 5000  # The amount of games played before it's time to increase epsilon
+def train(agent, game, num_epochs=10, stop=10000, epsilon_increase=0.05, m=5000, num_boards=0,
+          checkpoint_path=None, checkpoint_every=1, num_assessment_games=10000, metrics=None,
+          instrument_path=None, profile_epoch=None, early_stopping=None, use_kernel=True,
+          delta_checkpoints=False, opponent=None, seed=None, profile_path=None, profile_top=0):
+    """ :param agent: Agent object
+        :param game: Game object
+        :param num_epochs: number of training epochs
+        :param stop: number of training games per epoch
+        :param epsilon_increase: amount epsilon is increased by after 'm' games and before the last game
+        :param m: the amount of games played before it's time to increase epsilon
+        :param num_boards: number of boards to train on in lockstep with a VecGame. 0 trains one game at a time.
+        :param checkpoint_path: directory to save checkpoints in, or None for no checkpoints
+        :param checkpoint_every: the amount of epochs between checkpoints
+        :param num_assessment_games: games per batched assessment. 0 assesses with 10 games of assess_agent,
+                                     which is always used for agents and games that are not 3x3 with three in a row.
+        :param metrics: metrics.MetricsWriter (or any object with a write(dict) method) that a row of 
+                        statistics is written to after every epoch, or None
+        :param instrument_path: JSON lines file for per-epoch timings and counters, or None to turn
+                                instrumentation off
+        :param profile_epoch: epoch (starting from 1) to run under cProfile, or None
+        :param profile_path: file to save the pstats data of 'profile_epoch' to, or None for
+                             epoch_<N>.prof in the current directory
+        :param profile_top: number of the most expensive functions of 'profile_epoch' to print, 0 for none
+        :param early_stopping: convergence.EarlyStopping object, or None to always train for 'num_epochs'
+        :param use_kernel: if True, play the single-game training loop with kernel.train_games when it
+                           supports the agent and game, the opponent is the random one and instrumentation
+                           is off, which gives the same results faster
+        :param delta_checkpoints: if True, 'checkpoint_path' is a deltalog.DeltaLog, which stores only the
+                                  QMatrix rows changed since the previous checkpoint
+        :param opponent: Opponent object (see opponents.py) that the agent trains against, or None for
+                         opponent_moves. The assessments are always against the random opponent, so that
+                         runs with different training opponents can be compared.
+        :param seed: seed from which the seeds of the VecGame and of each assess_agent_batch call are derived
+                     (see derive_seed), or None. The random module and numpy's global generator are
+                     not seeded here.
+
+        Trains the agent for 'num_epochs' epochs, assessing it before training and after each epoch. If 
+        'checkpoint_path' holds a checkpoint, training resumes from it with the agent stored there instead. 
+        With 'early_stopping', training ends after the first epoch whose Q-value changes (as measured by 
+        agent.convergence) meet its criterion, and a run resumed after that does no more training.
+        Returns the agent, the list of assess_agent results (y_axis) and the list of assess_agent_batch 
+        results (assessments). """
+
+    if num_boards > 0:
+        agent.check_batch_size("Training on a VecGame", game)
+        vecgame = VecGame(num_boards, seed=derive_seed(seed, 0), opponent=opponent)
+    if agent.size != 3 or game.size != 3 or game.win_length != 3:
+        # The batched assessment only plays 3x3 boards with three in a row to win
+        num_assessment_games = 0
 
-    # Used for plotting agent's progress
-    x_axis = [i for i in range(num_epochs + 1)]
     y_axis = []
+    assessments = []
     
-    # Assess agent's performance before any training has occurred
-    player = 'X'
-    player, y_axis = assess_agent(player, agent, game, y_axis)
-    for epoch in range(num_epochs):
-        # Train agent and assess its performace
-        game.reset_board()
-        num_training_games = 0
-        while num_training_games < stop:
-            if num_training_games == m or num_training_games == (stop - 1):
-                agent.update_epsilon(epsilon_increase) 
+    delta_log = DeltaLog(checkpoint_path) if checkpoint_path is not None and delta_checkpoints else None
+    if delta_log is not None and len(delta_log.snapshots()) > 0:
+        resume = True
+    else:
+        resume = delta_log is None and checkpoint_path is not None and os.path.exists(os.path.join(checkpoint_path, META_FILE))
+
+    if resume:
+        # Resume an interrupted run from its last checkpoint
+        if delta_log is not None:
+            agent, training_state = delta_log.restore()
+        else:
+            agent, training_state = load_agent(checkpoint_path, writable=True)
+        start_epoch = training_state['epoch']
+        player = training_state['player']
+        y_axis = training_state['y_axis']
+        assessments = training_state['assessments']
+        print("Resuming training from the checkpoint in '{}' after epoch {}.".format(checkpoint_path, start_epoch))
+        if training_state.get('converged', False):
+            print("Training had already converged.")
+            start_epoch = num_epochs
+    else:
+        # Assess agent's performance before any training has occurred
+        start_epoch = 0
+        player = 'X'
+        if num_assessment_games > 0:
+            assessments = assess_agent_batch(agent, num_assessment_games, assessments, seed=derive_seed(seed, 1))
+        else:
+            player, y_axis = assess_agent(player, agent, game, y_axis)
+        if metrics is not None:
+            metrics.write(epoch_metrics(0, 0, 0.0, agent, y_axis, assessments, ConvergenceTracker().summary()))
+
+    # The timing wrappers patch classes and the profiler hooks the whole process, so both are removed
+    # however training ends
+    if instrument_path is not None:
+        STATS.enable(sys.modules[__name__])
+        instrument_file = open(instrument_path, "a")
+    profiler = None
+    try:
+        for epoch in range(start_epoch, num_epochs):
+            if epoch + 1 == profile_epoch:
+                profiler = start_profile()
+            STATS.reset()
+            agent.convergence.reset()
+            epoch_start = time.perf_counter()
+
+            # Train agent and assess its performace
+            game.reset_board()
+            num_training_games = 0
+
+            if num_boards > 0:
+                # Same epsilon schedule as below: increase it after 'm' games and before the last game
+                num_training_games += train_agent_batch(agent, vecgame, m)
+                agent.update_epsilon(epsilon_increase)
+                num_training_games += train_agent_batch(agent, vecgame, stop - 1 - num_training_games)
+                agent.update_epsilon(epsilon_increase)
+                num_training_games += train_agent_batch(agent, vecgame, stop - num_training_games)
 
-            result = train_agent(player, agent, game)
-            if result == "done":
-                num_training_games += 1
+            if use_kernel and opponent is None and instrument_path is None and supports(agent, game):
+                num_training_games, player = train_games(agent, player, num_training_games, stop, m, epsilon_increase)
 
-            if player == 'X':
-                player = 'O'
+            while num_training_games < stop:
+                if num_training_games == m or num_training_games == (stop - 1):
+                    agent.update_epsilon(epsilon_increase) 
+
+                result = train_agent(player, agent, game, opponent)
+                if result == "done":
+                    num_training_games += 1
+
+                if player == 'X':
+                    player = 'O'
+                else:
+                    player = 'X'
+
+            training_seconds = time.perf_counter() - epoch_start
+            convergence = agent.convergence.summary()
+            converged = early_stopping is not None and early_stopping.update(convergence)
+            game.reset_board()
+            if num_assessment_games > 0:
+                assessments = assess_agent_batch(agent, num_assessment_games, assessments,
+                                                 seed=derive_seed(seed, epoch + 2))
             else:
-                player = 'X'
+                player, y_axis = assess_agent(player, agent, game, y_axis)
+
+            if metrics is not None:
+                metrics.write(epoch_metrics(epoch + 1, num_training_games, training_seconds, agent, y_axis, assessments,
+                                            convergence))
+            if instrument_path is not None:
+                STATS.emit(instrument_file, epoch=epoch + 1, games=num_training_games)
+            if epoch + 1 == profile_epoch:
+                if profile_path is None:
+                    profile_path = "epoch_{}.prof".format(epoch + 1)
+                stop_profile(profiler, profile_path, top=profile_top)
+
+            if checkpoint_path is not None and ((epoch + 1) % checkpoint_every == 0 or epoch + 1 == num_epochs or converged):
+                training_state = {'epoch': epoch + 1, 'player': player, 'y_axis': y_axis, 'assessments': assessments,
+                                  'converged': converged}
+                if delta_log is not None:
+                    delta_log.append(agent, epoch + 1, training_state)
+                else:
+                    save_agent(agent, checkpoint_path, **training_state)
+
+            if converged:
+                print("Training converged after epoch {}: {} |delta Q| {:.3g} < {:g}.".format(
+                      epoch + 1, early_stopping.key.split('_')[0], convergence[early_stopping.key], early_stopping.tolerance))
+                break
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if instrument_path is not None:
+            STATS.disable()
+            instrument_file.close()
+
+    return agent, y_axis, assessments
+
+
+def epoch_metrics(epoch, num_training_games, training_seconds, agent, y_axis, assessments, convergence):
+    """ Returns a dictionary of the statistics written to 'metrics' by train() after an epoch: the epoch, 
+        training games and time, epsilon, the latest assessment (the number of wins out of 10 from 
+        assess_agent, or the rates from assess_agent_batch) and the ConvergenceTracker summary 
+        'convergence' of the epoch's updates. Every row of a run has the same keys, so the row for 
+        epoch 0 (before training) holds the summary of no updates. """
+
+    row = {'epoch': epoch,
+           'training_games': num_training_games,
+           'training_seconds': training_seconds,
+           'games_per_sec': num_training_games / training_seconds if training_seconds > 0 else 0.0,
+           'epsilon': agent.epsilon}
+    if assessments:
+        stats = assessments[-1]['all']
+        for name in ('win_rate', 'win_rate_lower', 'win_rate_upper', 'draw_rate', 'loss_rate'):
+            row[name] = stats[name]
+    elif y_axis:
+        row['wins_out_of_10'] = y_axis[-1]
+    row.update(convergence)
+    return row
+
+
+def plot_assessments(y_axis, assessments):
+    """ Plots the agent's progress with plot_progress, from the assess_agent_batch win rates if there are 
+        any and the assess_agent results otherwise. There is one assessment before training and one 
+        after each epoch. """
+
+    x_axis = [i for i in range(max(len(y_axis), len(assessments)))]
+    if assessments:
+        plot_progress(x_axis, [a['all']['win_rate'] for a in assessments], 
+                      lower=[a['all']['win_rate_lower'] for a in assessments],
+                      upper=[a['all']['win_rate_upper'] for a in assessments],
+                      ylabel="Win Rate against Random Opponent")
+    else:
+        plot_progress(x_axis, y_axis)
+
+
+def main():
+    # Initialize instance of the Game and Agent objects
+    # The game backend can be 'numpy', 'bitboard' or 'table' (see game.GAME_BACKENDS)
+    game = make_game(backend='table')
+    agent = Agent(eta=0.5, gamma=0.9, epsilon=0.1)
+
+    # Set hyperparameters
+    num_epochs = 10
+    record_path = None  # Episode file to record every game played on 'game' in (see episodes.py), or None
+
+    if record_path is not None:
+        recorder = EpisodeRecorder(record_path)
+        game = RecordingGame(game, recorder)
+
+    agent, y_axis, assessments = train(agent, game, num_epochs=num_epochs, 
+                                       stop=10000, 
+                                       epsilon_increase=0.05, 
+                                       m=5000, 
+                                       num_boards=0, 
+                                       checkpoint_path="agent_checkpoint", 
+                                       checkpoint_every=1, 
+                                       num_assessment_games=10000,
+                                       instrument_path=None,
+                                       profile_epoch=None)
 
-        game.reset_board()
-        player, y_axis = assess_agent(player, agent, game, y_axis)
-    
     # Plot agent's progress and play against user
-    plot_progress(x_axis, y_axis)
+    plot_assessments(y_axis, assessments)
     play_against_user(agent, game)
+
+    if record_path is not None:
+        game.reset_board()
+        recorder.close()
         
-    
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,241 @@
+import numpy as np
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+
+import states
+from deltalog import load_checkpoint
+from opponents import SWAPPED
+from policies import masked_argmax
+from vecgame import DRAW, POWERS_OF_THREE
+
+###########################
+# Round-robin tournaments #
+# between saved agents    #
+###########################
+
+# Entrant name for a player that moves uniformly at random, as a fixed point of the rating scale
+RANDOM_ENTRANT = "random"
+
+# Values in the outcome array of play_games. DRAW is the same as in VecGame.outcomes.
+FIRST_WON = 1
+SECOND_WON = 2
+
+# Set in each worker process by _init_worker
+_worker_agents = None
+
+
+def load_entrant(path):
+    """ :param path: checkpoint directory, or RANDOM_ENTRANT
+
+        Loads an agent read-only, with its QMatrix memory-mapped from the checkpoint, so every process
+        playing with it shares the same pages of the file. A delta log is restored into memory in each
+        process instead (see deltalog.load_checkpoint). Returns None for RANDOM_ENTRANT. """
+
+    if path == RANDOM_ENTRANT:
+        return None
+    agent, _ = load_checkpoint(path, mmap=True, writable=False)
+    return agent
+
+
+def entrant_values(agent, state):
+    """ Returns the Q-values of the boards 'state' (one row per board, in the board's own frame) for an
+        agent, or zeros for the random entrant, whose ties are then broken uniformly at random. """
+
+    if agent is None:
+        return np.zeros((len(state), 9))
+    return agent.action_values(state)
+
+
+def play_games(first, second, num_games, rng):
+    """ :param first: Agent object (or None for the random entrant) that moves first
+        :param second: Agent object (or None) that moves second
+        :param num_games: number of games to play at once
+        :param rng: numpy random generator used to break ties
+
+        Plays 'num_games' games between the greedy policies of two agents, as Agent.play_game does, ply
+        by ply on every board at once. The first mover places 'X'. Agents learn their Q-values as 'X', so
+        the second mover looks its boards up with the pieces swapped (opponents.SWAPPED). No Q-values are
+        changed. Returns the number of games won by the first mover, won by the second mover and drawn. """
+
+    state = np.zeros(num_games, dtype=np.int64)
+    outcome = np.zeros(num_games, dtype=np.int8)
+    players = (first, second)
+
+    for ply in range(9):
+        active = np.flatnonzero(outcome == 0)
+        if len(active) == 0:
+            break
+        mover = ply % 2
+        board = state[active]
+        view = board if mover == 0 else SWAPPED[board]
+
+        action = masked_argmax(entrant_values(players[mover], view), states.LEGAL[view], np_rng=rng)
+        board = board + (mover + 1) * POWERS_OF_THREE[action]
+        state[active] = board
+
+        won = states.X_WINS[board] if mover == 0 else states.O_WINS[board]
+        outcome[active[won]] = FIRST_WON if mover == 0 else SECOND_WON
+        outcome[active[~won & states.FULL[board]]] = DRAW
+
+    counts = np.bincount(outcome, minlength=4)
+    return int(counts[FIRST_WON]), int(counts[SECOND_WON]), int(counts[DRAW])
+
+
+def play_pairing(a, b, num_games, seed=None, num_boards=10000):
+    """ :param a: Agent object, or None for the random entrant
+        :param b: Agent object, or None for the random entrant
+        :param num_games: number of games, half of them started by each agent
+        :param seed: seed for breaking ties, or None
+        :param num_boards: largest number of games played at once
+
+        Returns a dictionary with the counts of the games a won, b won and drew, when 'a_first' and when
+        'b_first', as [a wins, b wins, draws]. """
+
+    rng = np.random.default_rng(seed)
+    results = {'a_first': [0, 0, 0], 'b_first': [0, 0, 0]}
+    for key, games in (('a_first', (num_games + 1) // 2), ('b_first', num_games // 2)):
+        while games > 0:
+            batch = min(games, num_boards)
+            if key == 'a_first':
+                a_wins, b_wins, draws = play_games(a, b, batch, rng)
+            else:
+                b_wins, a_wins, draws = play_games(b, a, batch, rng)
+            results[key] = [results[key][0] + a_wins, results[key][1] + b_wins, results[key][2] + draws]
+            games -= batch
+    return results
+
+
+def _init_worker(paths):
+    """ Pool initializer. Loads every entrant once per worker. The QMatrices are read-only memory maps,
+        so the workers share them through the page cache instead of each holding a copy. """
+
+    global _worker_agents
+
+    _worker_agents = [load_entrant(path) for path in paths]
+
+
+def _play_pairing(args):
+    """ :param args: tuple of (index of a, index of b, number of games, seed)
+
+        Pool task. Plays one pairing between the worker's entrants and returns the indices with the
+        play_pairing results. """
+
+    i, j, num_games, seed = args
+    return i, j, play_pairing(_worker_agents[i], _worker_agents[j], num_games, seed)
+
+
+def bradley_terry(points, games, prior=0.5, iterations=10000, tolerance=1e-10):
+    """ :param points: square array, points[i][j] is the points entrant i scored against j (1 for a win,
+                       0.5 for a draw)
+        :param games: square array of the number of games between each pair
+        :param prior: points added to both sides of every pair that played, as if they had drawn one more
+                      game, so that an entrant that never scored still gets a finite rating
+        :param iterations: largest number of iterations
+        :param tolerance: stop once no strength changes by more than this (relative)
+
+        Fits the Bradley-Terry model P(i beats j) = s_i / (s_i + s_j) by maximum likelihood with the MM
+        algorithm and returns the ratings on the Elo scale, 400 * log10(s_i), centred on a mean of 1500. """
+
+    played = games > 0
+    points = points + prior * played
+    games = games + 2 * prior * played
+    total_points = points.sum(axis=1)
+
+    strength = np.ones(len(points))
+    for _ in range(iterations):
+        denominator = (games / (strength[:, None] + strength[None, :])).sum(axis=1)
+        updated = total_points / denominator
+        updated /= np.exp(np.mean(np.log(updated)))
+        converged = np.max(np.abs(updated - strength) / strength) < tolerance
+        strength = updated
+        if converged:
+            break
+
+    ratings = 400 * np.log10(strength)
+    return ratings - ratings.mean() + 1500
+
+
+def run_tournament(paths, games_per_pair=10000, num_workers=None, seed=None, verbose=True):
+    """ :param paths: list of checkpoint directories (or RANDOM_ENTRANT)
+        :param games_per_pair: games played by every pair of entrants, half started by each
+        :param num_workers: number of worker processes, or None for one per CPU
+        :param seed: seed for the pairings, or None. Each pairing gets its own seed, so the results do
+                     not depend on the number of workers.
+        :param verbose: if True, print each pairing's result as it finishes
+
+        Plays a round robin between the entrants on a process pool and returns a dictionary with their
+        'names', the 'wins', 'draws' and 'games' matrices (wins[i][j] is the number of games i won against
+        j), the 'score' matrix (the fraction of the points i took from j), the results of every pairing by
+        seat order in 'pairings', and the Bradley-Terry 'ratings' on the Elo scale. """
+
+    n = len(paths)
+    seeds = random.Random(seed)
+    tasks = [(i, j, games_per_pair, seeds.randrange(2**63)) for i in range(n) for j in range(i + 1, n)]
+
+    wins = np.zeros((n, n), dtype=np.int64)
+    draws = np.zeros((n, n), dtype=np.int64)
+    pairings = []
+    num_workers = max(1, min(num_workers or os.cpu_count() or 1, len(tasks)))
+    with multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(paths,)) as pool:
+        for i, j, result in pool.imap_unordered(_play_pairing, tasks):
+            a_wins = result['a_first'][0] + result['b_first'][0]
+            b_wins = result['a_first'][1] + result['b_first'][1]
+            wins[i, j] += a_wins
+            wins[j, i] += b_wins
+            draws[i, j] = draws[j, i] = result['a_first'][2] + result['b_first'][2]
+            pairings.append({'a': paths[i], 'b': paths[j], 'a_first': result['a_first'], 'b_first': result['b_first']})
+            if verbose:
+                print("{} vs {}: {} - {}, {} draws".format(paths[i], paths[j], a_wins, b_wins, draws[i, j]))
+
+    games = wins + wins.T + draws
+    points = wins + 0.5 * draws
+    with np.errstate(invalid='ignore'):
+        score = np.where(games > 0, points / np.maximum(games, 1), np.nan)
+
+    return {'names': list(paths),
+            'wins': wins.tolist(),
+            'draws': draws.tolist(),
+            'games': games.tolist(),
+            'score': [[None if math.isnan(value) else value for value in row] for row in score.tolist()],
+            'pairings': pairings,
+            'ratings': bradley_terry(points, games).tolist()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a round-robin tournament between saved agents and rate them.")
+    parser.add_argument('checkpoints', nargs='+',
+                        help="checkpoint directories of the agents; '{}' adds a random player".format(RANDOM_ENTRANT))
+    parser.add_argument('--games', type=int, default=10000, help="games per pair of agents, half started by each")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    if len(args.checkpoints) < 2:
+        parser.error("a tournament needs at least two agents")
+
+    results = run_tournament(args.checkpoints, args.games, args.workers, args.seed)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+
+    names = results['names']
+    width = max(len(name) for name in names)
+    print("\nScore of each row against each column:")
+    print(" " * width + "".join(" {:>7}".format("#{}".format(k + 1)) for k in range(len(names))))
+    for k, (name, row) in enumerate(zip(names, results['score'])):
+        print("{:<{}}".format(name, width) + "".join(" {:>7}".format("-" if value is None else "{:.3f}".format(value))
+                                                  for value in row) + "   #{}".format(k + 1))
+
+    print("\nRatings:")
+    for rating, name in sorted(zip(results['ratings'], names), reverse=True):
+        print("{:>7.1f}  {}".format(rating, name))
+
+
+if __name__ == '__main__':
+    main()
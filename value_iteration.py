@@ -0,0 +1,157 @@
+import numpy as np
+
+import time
+
+import solver
+import states
+import symmetry
+
+############################
+# Value iteration over the #
+# whole state graph        #
+############################
+
+
+def build_transitions(opponent=None):
+    """ :param opponent: Opponent object with a compiled 'table', or None for the random opponent
+
+        Builds the afterstate transition graph of the agent ('X') playing against 'opponent'. Every legal
+        (state, action) pair in a state where the agent can be to move is a 'pair'. Returns a dictionary of:
+
+        agent_states: array of the states where the agent can be to move (see solver.agent_states)
+        pair_states, pair_actions: the state and action of every pair
+        immediate: expected reward of every pair that does not depend on later moves: 1 if the agent's move
+                   wins, 0.5 if it fills the board, and 0.5 times the probability that the opponent's reply
+                   fills the board. A loss is worth 0, as in Agent.qlearning.
+        next_pairs, next_states, next_probs: for every way the game can carry on, the pair it came from, the
+                   state the agent is then to move in and its probability """
+
+    agent_states = solver.agent_states()
+    legal = states.CELLS[agent_states] == 0
+    rows, actions = np.nonzero(legal)
+    pair_states = agent_states[rows]
+    after = states.SUCCESSOR[pair_states, 0, actions]
+
+    won = states.X_WINS[after]
+    filled = ~won & states.FULL[after]
+    immediate = np.where(won, 1.0, np.where(filled, 0.5, 0.0))
+
+    # Probability of each of the opponent's replies, for the pairs where the game carries on
+    going = np.flatnonzero(~won & ~filled)
+    going_after = after[going]
+    replies = states.SUCCESSOR[going_after, 1, :]
+    reply_legal = replies >= 0
+    probs = reply_legal / reply_legal.sum(axis=1, keepdims=True)
+    if opponent is not None and opponent.table is not None:
+        chosen = np.zeros_like(probs)
+        chosen[np.arange(len(going)), opponent.table[going_after]] = 1.0
+        probs = opponent.epsilon * probs + (1 - opponent.epsilon) * chosen
+
+    reply_rows, reply_cells = np.nonzero(reply_legal & (probs > 0))
+    reply_states = replies[reply_rows, reply_cells]
+    reply_probs = probs[reply_rows, reply_cells]
+    reply_pairs = going[reply_rows]
+
+    lost = states.O_WINS[reply_states]
+    drawn = ~lost & states.FULL[reply_states]
+    immediate += 0.5 * np.bincount(reply_pairs[drawn], weights=reply_probs[drawn], minlength=len(pair_states))
+    carries_on = ~lost & ~drawn
+
+    return {'agent_states': agent_states,
+            'pair_states': pair_states,
+            'pair_actions': actions,
+            'immediate': immediate,
+            'next_pairs': reply_pairs[carries_on],
+            'next_states': reply_states[carries_on],
+            'next_probs': reply_probs[carries_on]}
+
+
+def value_iteration(gamma, opponent=None, tolerance=1e-10, max_iterations=100, transitions=None):
+    """ :param gamma: float between (0.0, 1.0], the discount applied to each of the agent's later moves
+        :param opponent: Opponent object with a compiled 'table', or None for the random opponent
+        :param tolerance: stop once no Q-value changes by more than this in one sweep
+        :param max_iterations: maximum number of sweeps
+        :param transitions: dictionary from build_transitions, to reuse one built earlier
+
+        Runs Bellman backups Q(s,a) = immediate(s,a) + gamma * E[max_a' Q(s',a')] over every pair at once
+        until the values converge. Since a game lasts at most five agent moves, this takes only a handful
+        of sweeps. Returns a dense (3^9, 9) QMatrix in the same layout as Agent.qmatrix (zero for illegal
+        moves and positions where the agent is never to move) and the number of sweeps run. """
+
+    if transitions is None:
+        transitions = build_transitions(opponent)
+
+    pair_states = transitions['pair_states']
+    pair_actions = transitions['pair_actions']
+    immediate = transitions['immediate']
+    next_pairs = transitions['next_pairs']
+    next_states = transitions['next_states']
+    next_probs = transitions['next_probs']
+
+    qmatrix = np.zeros((states.NUM_STATES, 9))
+    legal = states.CELLS == 0
+    values = np.zeros(states.NUM_STATES)
+    pair_values = np.zeros(len(pair_states))
+
+    for iteration in range(1, max_iterations + 1):
+        expected = np.bincount(next_pairs, weights=next_probs * values[next_states], minlength=len(pair_states))
+        new_pair_values = immediate + gamma * expected
+        change = np.max(np.abs(new_pair_values - pair_values)) if len(pair_values) > 0 else 0.0
+        pair_values = new_pair_values
+
+        qmatrix[pair_states, pair_actions] = pair_values
+        values[transitions['agent_states']] = np.where(legal[transitions['agent_states']],
+                                                       qmatrix[transitions['agent_states']], -np.inf).max(axis=1)
+        if change <= tolerance:
+            break
+
+    return qmatrix, iteration
+
+
+def train_value_iteration(agent, opponent=None, tolerance=1e-10):
+    """ :param agent: Agent object
+        :param opponent: Opponent object with a compiled 'table', or None for the random opponent
+        :param tolerance: passed on to value_iteration
+
+        Replaces the agent's Q-values with the converged ones from value_iteration (using the agent's gamma),
+        for a dense, compact or symmetric QMatrix. Returns the dense QMatrix and the time taken in seconds. """
+
+    start = time.perf_counter()
+    qmatrix, _ = value_iteration(agent.gamma, opponent, tolerance)
+
+    if agent.symmetric:
+        rows = np.unique(symmetry.CANONICAL[states.REACHABLE])
+    elif isinstance(agent.qmatrix, np.ndarray):
+        rows = np.arange(states.NUM_STATES)
+    else:
+        rows = states.REACHABLE
+    agent.qmatrix[rows] = qmatrix[rows]
+    agent.convergence.mark_dirty(rows)
+
+    return qmatrix, time.perf_counter() - start
+
+
+def convergence_gap(agent, qmatrix):
+    """ :param agent: Agent object
+        :param qmatrix: dense QMatrix from value_iteration
+
+        Compares the agent's Q-values with 'qmatrix' over every legal move in every state where the agent
+        can be to move. Returns a dictionary with the 'max_error' and 'mean_error' of the Q-values and the
+        'policy_agreement', the fraction of those states where the agent's greedy move is also greedy
+        under 'qmatrix' (ties in the agent's values count as a disagreement unless every tied move agrees). """
+
+    agent_states = solver.agent_states()
+    legal = states.CELLS[agent_states] == 0
+    agent_values = agent.action_values(agent_states).astype(np.float64)
+    exact_values = qmatrix[agent_states]
+
+    errors = np.abs(agent_values - exact_values)[legal]
+
+    masked_agent = np.where(legal, agent_values, -np.inf)
+    masked_exact = np.where(legal, exact_values, -np.inf)
+    agent_greedy = masked_agent == masked_agent.max(axis=1, keepdims=True)
+    exact_greedy = np.isclose(masked_exact, masked_exact.max(axis=1, keepdims=True))
+    agreement = ~np.any(agent_greedy & ~exact_greedy, axis=1)
+
+    return {'max_error': float(errors.max()), 'mean_error': float(errors.mean()),
+            'policy_agreement': float(agreement.mean())}
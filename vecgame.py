@@ -0,0 +1,161 @@
+import numpy as np
+
+import states
+
+##########################
+# Batch of tic-tac-toe   #
+# games played lockstep  #
+##########################
+
+POWERS_OF_THREE = 3 ** np.arange(9)
+
+# Values stored in VecGame.outcomes
+IN_PROGRESS = 0
+AGENT_WON = 1
+OPPONENT_WON = 2
+DRAW = 3
+
+
+class VecGame(object):
+
+    def __init__(self, num_boards, seed=None, opponent=None):
+        """ :param num_boards: number of boards played at once
+            :param seed: seed for the opponent's random moves, or None
+            :param opponent: Opponent object (see opponents.py), or None for a uniformly random opponent
+
+            Holds 'num_boards' boards in one (num_boards, 9) array using the same cell values as Game
+            (0 empty, 1 'X', 2 'O'), along with each board's QMatrix row index. The agent is always 'X'
+            and plays against 'O'. Boards alternate between the agent and the opponent making the
+            first move: even boards start with the agent, odd boards with the opponent, and each board
+            swaps every time it is reset. An opponent with a compiled 'table' moves by looking up every
+            board's state in it at once (still playing randomly with probability opponent.epsilon). """
+
+        self.num_boards = num_boards
+        self.rng = np.random.default_rng(seed)
+        self.opponent = opponent
+        self.boards = np.zeros((num_boards, 9), dtype=np.int8)
+        self.states = np.zeros(num_boards, dtype=np.int64)
+        self.agent_first = np.arange(num_boards) % 2 == 0
+        self.done = np.zeros(num_boards, dtype=bool)
+        self.outcomes = np.zeros(num_boards, dtype=np.int8)
+        self.reset()
+
+
+    def reset(self):
+        """ Resets every board (the opponent makes its first move where it goes first) and returns
+            a copy of the state indices. """
+
+        self.boards[:] = 0
+        self.states[:] = 0
+        self.done[:] = False
+        self.outcomes[:] = IN_PROGRESS
+        self._opponent_move(~self.agent_first)
+        return self.states.copy()
+
+
+    def reset_boards(self, boards):
+        """ :param boards: boolean array of length num_boards
+
+            Resets the selected boards and swaps which side moves first on them. If the opponent now
+            moves first, it makes its opening move straight away. The outcomes of the finished games
+            are kept until the agent's next move. """
+
+        self.boards[boards] = 0
+        self.states[boards] = 0
+        self.done[boards] = False
+        self.agent_first[boards] = ~self.agent_first[boards]
+        self._opponent_move(boards & ~self.agent_first)
+
+
+    def legal_moves(self):
+        """ Returns a (num_boards, 9) boolean array that is True for every empty cell. """
+
+        return self.boards == 0
+
+
+    def move(self, actions):
+        """ :param actions: integer array of length num_boards with a cell (0-8) per board
+
+            Makes the agent's move on every board that is still in play; actions for finished
+            boards are ignored. Returns the state indices, the agent's rewards (1 for a win,
+            0.5 for a draw, 0 otherwise) and the done flags as arrays. Raises ValueError if any
+            action is for an occupied cell. """
+
+        active = ~self.done
+        self.outcomes[active] = IN_PROGRESS
+        rows = np.flatnonzero(active)
+        cells = np.asarray(actions)[rows]
+        if np.any(self.boards[rows, cells] != 0):
+            raise ValueError("Agent tried to move into an occupied cell.")
+
+        self.boards[rows, cells] = 1
+        self.states[rows] += POWERS_OF_THREE[cells]
+
+        rewards = np.zeros(self.num_boards)
+        won = active & states.X_WINS[self.states]
+        draw = active & ~won & states.FULL[self.states]
+        rewards[won] = 1.0
+        rewards[draw] = 0.5
+        self._finish(won, AGENT_WON)
+        self._finish(draw, DRAW)
+
+        return self.states.copy(), rewards, self.done.copy()
+
+
+    def respond(self):
+        """ Makes the opponent's move on every board that is still in play. Returns the
+            state indices, the agent's rewards (0.5 for a draw, 0 otherwise) and the done flags. """
+
+        active = ~self.done
+        self._opponent_move(active)
+
+        rewards = np.zeros(self.num_boards)
+        lost = active & states.O_WINS[self.states]
+        draw = active & ~lost & states.FULL[self.states]
+        rewards[draw] = 0.5
+        self._finish(lost, OPPONENT_WON)
+        self._finish(draw, DRAW)
+
+        return self.states.copy(), rewards, self.done.copy()
+
+
+    def step(self, actions):
+        """ :param actions: integer array of length num_boards with a cell (0-8) per board
+
+            Plays the agent's moves followed by the opponent's replies, then resets the boards that
+            finished. Returns the state indices the moves led to (the final boards, for games that
+            ended), the agent's rewards and the done flags. The outcomes of finished games are in
+            'outcomes' until the next step. """
+
+        _, agent_rewards, _ = self.move(actions)
+        next_states, opponent_rewards, done = self.respond()
+        self.reset_boards(done)
+        return next_states, agent_rewards + opponent_rewards, done
+
+
+    def _opponent_move(self, boards):
+        """ :param boards: boolean array of length num_boards
+
+            Places an 'O' on each selected board: from the opponent's table, or in a uniformly random 
+            empty cell for a random opponent and for a fraction opponent.epsilon of the boards. """
+
+        rows = np.flatnonzero(boards)
+        if len(rows) == 0:
+            return
+
+        noise = self.rng.random((len(rows), 9))
+        noise[self.boards[rows] != 0] = -1.0
+        cells = noise.argmax(axis=1)
+
+        if self.opponent is not None and self.opponent.table is not None:
+            use_table = self.rng.random(len(rows)) >= self.opponent.epsilon
+            cells[use_table] = self.opponent.table[self.states[rows[use_table]]]
+        self.boards[rows, cells] = 2
+        self.states[rows] += 2 * POWERS_OF_THREE[cells]
+
+
+    def _finish(self, boards, outcome):
+        """ Marks the selected boards as done with the given outcome. """
+
+        self.done |= boards
+        self.outcomes[boards] = outcome